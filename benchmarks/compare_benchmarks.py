@@ -0,0 +1,55 @@
+# Compares two result files written by run_benchmarks.sage.
+
+# Usage:
+#   python3 compare_benchmarks.py OLD NEW
+# Lists the computations timed in both files with the ratio of the times,
+# and flags computations whose status or result summary changed.
+
+import json
+import sys
+
+
+def load_results(filename):
+    r"""
+    Return the results of a benchmark file as a dictionary indexed by
+    triples ``(family, label, function)``.
+    """
+    with open(filename) as f:
+        data = json.load(f)
+    return {(r['family'], r['label'], r['function']): r
+            for r in data['results']}
+
+
+def compare(old, new):
+    r"""
+    Return a list of lines comparing the results ``old`` and ``new`` as
+    returned by :func:`load_results`.
+    """
+    lines = ["%-10s %-24s %-22s %10s %10s %7s" % (
+        "family", "label", "function", "old (s)", "new (s)", "ratio")]
+    for key in sorted(set(old) & set(new)):
+        r_old = old[key]
+        r_new = new[key]
+        ratio = ""
+        if r_old['status'] == r_new['status'] == 'ok' and r_old['time'] > 0:
+            ratio = "%.2f" % (r_new['time'] / r_old['time'])
+        line = "%-10s %-24s %-22s %10.2f %10.2f %7s" % (
+            key + (r_old['time'], r_new['time'], ratio))
+        if r_old['status'] != r_new['status']:
+            line += "  status %s -> %s" % (r_old['status'], r_new['status'])
+        elif r_old['summary'] != r_new['summary']:
+            line += "  result changed"
+        lines.append(line)
+
+    for key in sorted(set(old) ^ set(new)):
+        which = "old" if key in old else "new"
+        lines.append("%-10s %-24s %-22s only in %s" % (key + (which,)))
+    return lines
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: python3 compare_benchmarks.py OLD NEW")
+        sys.exit(1)
+    for line in compare(load_results(sys.argv[1]), load_results(sys.argv[2])):
+        print(line)
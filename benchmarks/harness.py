@@ -0,0 +1,331 @@
+import json
+import multiprocessing
+import platform
+import subprocess
+import traceback
+from datetime import datetime
+from time import time
+
+from sage.algebras.lie_algebras.lie_algebra import LieAlgebra
+from sage.env import SAGE_VERSION
+from sage.rings.qqbar import QQbar
+
+from lie_gradings.classification.lists import lie_algebra_isomorphism_classes
+from lie_gradings.gradings.grading import (maximal_grading,
+                                           torsion_free_gradings,
+                                           stratification)
+
+FUNCTIONS = {
+    'maximal_grading': maximal_grading,
+    'torsion_free_gradings': torsion_free_gradings,
+    'stratification': stratification,
+}
+
+# messages of exceptions that are valid outcomes of the functions
+EXPECTED_ERRORS = {
+    'stratification': "is not a stratifiable Lie algebra",
+}
+
+
+def free_nilpotent_family(F, ranks, steps):
+    r"""
+    Return a list of pairs ``(label, L)`` of free nilpotent Lie algebras.
+
+    INPUT:
+
+    - ``F`` -- the base field
+    - ``ranks`` -- an iterable of numbers of generators
+    - ``steps`` -- an iterable of nilpotency steps
+
+    EXAMPLES::
+
+        sage: import sys, pathlib
+        sage: sys.path.append(str(pathlib.Path().absolute()))
+        sage: from benchmarks.harness import free_nilpotent_family
+        sage: [(label, L.dimension())
+        ....:  for label, L in free_nilpotent_family(QQ, [2, 3], [2])]
+        [('F(2,2)', 3), ('F(3,2)', 6)]
+    """
+    return [("F(%d,%d)" % (r, s), LieAlgebra(F, r, step=s))
+            for r in ranks for s in steps]
+
+
+def heisenberg_product(F, m):
+    r"""
+    Return the direct product of ``m`` copies of the first Heisenberg
+    Lie algebra.
+
+    EXAMPLES::
+
+        sage: from benchmarks.harness import heisenberg_product
+        sage: L = heisenberg_product(QQ, 2); L
+        Lie algebra on 6 generators (X_1, Y_1, Z_1, X_2, Y_2, Z_2) over
+        Rational Field
+        sage: L.center().dimension()
+        2
+    """
+    sc = {}
+    names = []
+    for k in range(1, m + 1):
+        X, Y, Z = "X_%d" % k, "Y_%d" % k, "Z_%d" % k
+        names.extend([X, Y, Z])
+        sc[(X, Y)] = {Z: 1}
+    return LieAlgebra(F, sc, names=names)
+
+
+def heisenberg_product_family(F, counts):
+    r"""
+    Return a list of pairs ``(label, L)`` of direct products of
+    Heisenberg Lie algebras.
+
+    INPUT:
+
+    - ``F`` -- the base field
+    - ``counts`` -- an iterable of numbers of factors
+    """
+    return [("H^%d" % m, heisenberg_product(F, m)) for m in counts]
+
+
+def classification_family(F, dims):
+    r"""
+    Return a list of pairs ``(label, L)`` of the classified nilpotent Lie
+    algebras of the given dimensions.
+
+    INPUT:
+
+    - ``F`` -- the base field
+    - ``dims`` -- an iterable of dimensions between 1 and 7
+    """
+    return [(L._classification, L)
+            for d in dims for L in lie_algebra_isomorphism_classes(F, d)]
+
+
+def _summary(name, result):
+    r"""
+    Return a short description of the result of the benchmarked function
+    ``name``, used to check that compared runs computed the same thing.
+    """
+    if name == 'maximal_grading':
+        return "rank %d" % len(result.magma().gens())
+    if name == 'torsion_free_gradings':
+        return "%d gradings" % len(result)
+    return "stratified"
+
+
+def _peak_rss():
+    r"""
+    Return the peak resident set size of the current process in
+    kilobytes, or ``None`` if it is not available.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    r"""
+    Reset the peak resident set size of the current process to its
+    current resident set size, and return whether this was possible.
+
+    A forked process inherits the peak of its parent, so the peak has to
+    be reset before measuring a computation.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def _measure(name, L, conn):
+    r"""
+    Compute ``FUNCTIONS[name](L)`` and send a dictionary of the status,
+    the wall time and the peak memory to the pipe ``conn``.
+
+    The peak memory is the growth of the resident set size of the
+    process during the computation in kilobytes, measured from the peak
+    resident set size reset at the start. It is ``None`` on systems where
+    the peak cannot be reset.
+
+    Exceptions are reported with the status ``'error'``, except for
+    those listed in :data:`EXPECTED_ERRORS`.
+    """
+    func = FUNCTIONS[name]
+    rss = _peak_rss() if _reset_peak_rss() else None
+    stime = time()
+    try:
+        result = func(L)
+    except Exception as e:
+        expected = EXPECTED_ERRORS.get(name)
+        if (isinstance(e, ValueError) and expected is not None
+                and expected in str(e)):
+            # e.g. a non-stratifiable Lie algebra, a valid outcome
+            out = {'status': 'ok', 'summary': str(e)}
+        else:
+            out = {'status': 'error', 'summary': traceback.format_exc()}
+    else:
+        out = {'status': 'ok', 'summary': _summary(name, result)}
+    out['time'] = time() - stime
+    peak = _peak_rss()
+    out['memory'] = None if rss is None or peak is None else peak - rss
+    conn.send(out)
+    conn.close()
+
+
+def run_benchmark(name, L, timeout=None):
+    r"""
+    Time a function on a Lie algebra in a separate process.
+
+    Each computation runs in a freshly forked process, so that the
+    computations do not share caches and the peak memory of each
+    computation is measured separately.
+
+    INPUT:
+
+    - ``name`` -- the name of a function in :data:`FUNCTIONS`
+    - ``L`` -- a Lie algebra
+    - ``timeout`` -- (default:``None``) a time limit in seconds; if
+      exceeded, the computation is terminated
+
+    OUTPUT:
+
+    A dictionary with keys ``'status'`` (one of ``'ok'``, ``'error'``,
+    ``'timeout'`` and ``'crashed'``), ``'time'`` in seconds, ``'memory'``
+    in kilobytes or ``None`` if it cannot be measured, and ``'summary'``,
+    a short description of the result or the traceback of an error.
+
+    EXAMPLES::
+
+        sage: from benchmarks.harness import run_benchmark
+        sage: out = run_benchmark('maximal_grading', lie_algebras.Heisenberg(QQ, 1))
+        sage: out['status'], out['summary']
+        ('ok', 'rank 2')
+        sage: sorted(out)
+        ['memory', 'status', 'summary', 'time']
+
+    Unexpected exceptions are reported as errors::
+
+        sage: run_benchmark('maximal_grading', None)['status']
+        'error'
+    """
+    ctx = multiprocessing.get_context('fork')
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_measure, args=(name, L, send))
+    stime = time()
+    proc.start()
+    send.close()
+
+    if recv.poll(timeout):
+        try:
+            out = recv.recv()
+        except EOFError:
+            out = None
+    else:
+        out = {'status': 'timeout', 'time': time() - stime,
+               'memory': None, 'summary': None}
+        proc.terminate()
+    proc.join()
+    if out is None:
+        out = {'status': 'crashed', 'time': time() - stime, 'memory': None,
+               'summary': "exit code %s" % proc.exitcode}
+    return out
+
+
+def _git_commit():
+    r"""
+    Return the current git commit of the repository, or ``None``.
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def run_benchmarks(families, functions=None, timeout=None, verbose=True):
+    r"""
+    Time functions on families of Lie algebras.
+
+    INPUT:
+
+    - ``families`` -- a dictionary of lists of pairs ``(label, L)``
+      indexed by family names
+    - ``functions`` -- (default:``None``) a list of names of functions
+      in :data:`FUNCTIONS`; if ``None``, all functions are timed
+    - ``timeout`` -- (default:``None``) a time limit in seconds for each
+      computation
+    - ``verbose`` -- (default:``True``) whether to print progress
+
+    OUTPUT:
+
+    A dictionary with the keys ``'commit'``, ``'sage_version'``,
+    ``'machine'``, ``'date'`` and ``'results'``, where ``'results'`` is
+    a list of dictionaries as returned by :func:`run_benchmark`,
+    extended by the keys ``'family'``, ``'label'``, ``'dimension'`` and
+    ``'function'``.
+
+    EXAMPLES::
+
+        sage: from benchmarks.harness import run_benchmarks, heisenberg_product_family
+        sage: data = run_benchmarks({'H': heisenberg_product_family(QQ, [1])},
+        ....:                       functions=['stratification'], verbose=False)
+        sage: [(r['label'], r['status']) for r in data['results']]
+        [('H^1', 'ok')]
+    """
+    if functions is None:
+        functions = list(FUNCTIONS)
+
+    results = []
+    for family, algebras in families.items():
+        for label, L in algebras:
+            for name in functions:
+                out = run_benchmark(name, L, timeout=timeout)
+                out.update({'family': family, 'label': label,
+                            'dimension': L.dimension(), 'function': name})
+                results.append(out)
+                if verbose:
+                    print("  %-10s %-24s %-22s %-8s %9.2f s" % (
+                        family, label, name, out['status'], out['time']))
+
+    return {'commit': _git_commit(),
+            'sage_version': SAGE_VERSION,
+            'machine': platform.platform(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'results': results}
+
+
+def save_results(data, filename):
+    r"""
+    Write the output of :func:`run_benchmarks` to ``filename`` as JSON.
+    """
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def default_families(F=QQbar, max_rank=4, max_step=4, max_factors=4,
+                     dims=range(2, 8)):
+    r"""
+    Return the default benchmark families.
+
+    INPUT:
+
+    - ``F`` -- (default:``QQbar``) the base field
+    - ``max_rank``, ``max_step`` -- (default:``4``) bounds for the free
+      nilpotent Lie algebras
+    - ``max_factors`` -- (default:``4``) a bound for the number of
+      factors of the products of Heisenberg algebras
+    - ``dims`` -- (default:``range(2, 8)``) the dimensions of the
+      classified Lie algebras
+    """
+    return {'free': free_nilpotent_family(F, range(2, max_rank + 1),
+                                          range(2, max_step + 1)),
+            'heisenberg': heisenberg_product_family(F,
+                                                    range(1, max_factors + 1)),
+            'classification': classification_family(F, dims)}
@@ -1,2 +1,6 @@
 from .grading import *
-from .lie_algebra_grading import *
\ No newline at end of file
+from .lie_algebra_grading import *
+from .cache import *
+from .parallel import *
+from .profiling import *
+from .records import *
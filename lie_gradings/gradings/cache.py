@@ -0,0 +1,356 @@
+import hashlib
+import os
+import tempfile
+from sage.misc.persist import dumps, loads
+from sage.rings.rational_field import QQ
+
+from lie_gradings.gradings.lie_algebra_grading import grading
+
+__all__ = ['MaximalGradingCache', 'enable_maximal_grading_cache',
+           'disable_maximal_grading_cache', 'maximal_grading_cache',
+           'lie_algebra_fingerprint']
+
+_active_cache = None
+
+# the version of the stored data; entries of other versions are not read
+CACHE_FORMAT = 1
+
+
+def _coefficient_string(c):
+    r"""
+    Return a canonical string representation of a structure coefficient.
+
+    Rational numbers are represented exactly. Other algebraic numbers are
+    represented by their minimal polynomial together with a numerical
+    approximation isolating the root.
+
+    EXAMPLES::
+
+        sage: import sys, pathlib
+        sage: sys.path.append(str(pathlib.Path().absolute()))
+        sage: from lie_gradings.gradings.cache import _coefficient_string
+        sage: _coefficient_string(QQbar(1/2))
+        '1/2'
+        sage: _coefficient_string(QQbar(2).sqrt())
+        'x^2 - 2@1.41421356237309504880168872421'
+    """
+    try:
+        return str(QQ(c))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return "%s@%s" % (c.minpoly(), c.numerical_approx(digits=30))
+    except (AttributeError, NotImplementedError):
+        return str(c)
+
+
+def lie_algebra_fingerprint(L):
+    r"""
+    Return a fingerprint of the Lie algebra based on its base ring and
+    its structure coefficients.
+
+    Lie algebras with the same base ring and the same structure
+    coefficients in the same ordering of the basis have the same
+    fingerprint, regardless of the names of the basis elements.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.cache import lie_algebra_fingerprint
+        sage: L.<X,Y,Z> = LieAlgebra(QQ, {('X','Y'): {'Z': 1}})
+        sage: K.<A,B,C> = LieAlgebra(QQ, {('B','A'): {'C': -1}})
+        sage: lie_algebra_fingerprint(L) == lie_algebra_fingerprint(K)
+        True
+        sage: H.<A,B,C> = LieAlgebra(QQbar, {('A','B'): {'C': 1}})
+        sage: lie_algebra_fingerprint(L) == lie_algebra_fingerprint(H)
+        False
+    """
+    keys = list(L.basis().keys())
+    index = {x: i for i, x in enumerate(keys)}
+
+    brackets = []
+    for (x, y), v in L.structure_coefficients().items():
+        i = index[x]
+        j = index[y]
+        sign = 1
+        if j < i:
+            i, j = j, i
+            sign = -1
+        for z, c in v.monomial_coefficients().items():
+            if c:
+                brackets.append("%d,%d,%d:%s" % (i, j, index[z],
+                                                 _coefficient_string(sign * c)))
+
+    data = [repr(L.base_ring()), str(len(keys))] + sorted(brackets)
+    return hashlib.sha256("\n".join(data).encode()).hexdigest()
+
+
+class MaximalGradingCache(object):
+    r"""
+    A persistent on-disk cache of maximal gradings.
+
+    The gradings are stored in the directory ``directory`` in files named
+    by the fingerprints of the Lie algebras, see
+    :func:`lie_algebra_fingerprint`. Files are written atomically, so the
+    same directory may be shared by several concurrent processes. When a
+    size limit is exceeded, the least recently used entries are evicted.
+
+    INPUT:
+
+    - ``directory`` -- a path to a directory to store the cache in; the
+      directory is created if it does not exist
+    - ``max_entries`` -- (default:``None``) the maximum number of stored
+      gradings; if ``None``, the number is unbounded
+    - ``max_size`` -- (default:``None``) the maximum total size of stored
+      gradings in bytes; if ``None``, the size is unbounded
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.cache import MaximalGradingCache
+        sage: from lie_gradings.gradings.grading import maximal_grading
+        sage: cache = MaximalGradingCache(tmp_dir())
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: cache.get(L) is None
+        True
+        sage: gr = maximal_grading(L)
+        sage: cache.store(L, gr)
+        sage: cache.get(L) is gr
+        True
+        sage: cache.stats()
+        {'entries': 1, 'evictions': 0, 'hits': 1, 'misses': 1, 'size': ..., 'stores': 1}
+
+    The least recently used gradings are evicted when the cache is full::
+
+        sage: cache = MaximalGradingCache(tmp_dir(), max_entries=1)
+        sage: K = LieAlgebra(QQ, 3, step=2)
+        sage: cache.store(L, gr)
+        sage: cache.store(K, maximal_grading(K))
+        sage: len(cache)
+        1
+        sage: L in cache, K in cache
+        (False, True)
+    """
+
+    suffix = ".maxgrading"
+
+    def __init__(self, directory, max_entries=None, max_size=None):
+        self._directory = str(directory)
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        os.makedirs(self._directory, exist_ok=True)
+
+    def __repr__(self):
+        return "Maximal grading cache in %s" % self._directory
+
+    def _path(self, L):
+        fname = lie_algebra_fingerprint(L) + self.suffix
+        return os.path.join(self._directory, fname)
+
+    def _entries(self):
+        r"""
+        Return a list of triples ``(mtime, size, path)`` of the stored
+        gradings.
+        """
+        entries = []
+        for entry in os.scandir(self._directory):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                # removed by a concurrent process
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        return entries
+
+    def __contains__(self, L):
+        return os.path.isfile(self._path(L))
+
+    def __len__(self):
+        return len(self._entries())
+
+    def get(self, L):
+        r"""
+        Return the cached maximal grading of ``L``, or ``None`` if no
+        grading is cached.
+
+        A cached grading of an identical copy of ``L`` is transferred to a
+        grading of ``L``.
+
+        INPUT:
+
+        - ``L`` -- a Lie algebra
+        """
+        path = self._path(L)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            version, gr = loads(data)
+            if version != CACHE_FORMAT:
+                raise ValueError("outdated cache entry")
+        except FileNotFoundError:
+            self._misses += 1
+            return None
+        except Exception:
+            # unreadable entry, discard it
+            self._discard(path)
+            self._misses += 1
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._hits += 1
+
+        if gr.lie_algebra() is not L:
+            layers = {a: [L.from_vector(X.to_vector()) for X in la]
+                      for a, la in gr.layers().items()}
+            gr = grading(L, layers, magma=gr.magma(), projections=True)
+        return gr
+
+    def store(self, L, gr):
+        r"""
+        Store the maximal grading ``gr`` of ``L`` in the cache.
+
+        INPUT:
+
+        - ``L`` -- a Lie algebra
+        - ``gr`` -- a maximal grading of ``L``; it must be computed by a
+          full search for a maximal torus, since the stored gradings are
+          trusted to be maximal
+        """
+        path = self._path(L)
+        fd, tmppath = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(dumps((CACHE_FORMAT, gr)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmppath, path)
+        except BaseException:
+            self._discard(tmppath)
+            raise
+        self._stores += 1
+        self._evict(keep=path)
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep=None):
+        r"""
+        Remove least recently used entries other than ``keep`` until the
+        size limits hold.
+        """
+        if self._max_entries is None and self._max_size is None:
+            return
+
+        entries = sorted(self._entries())
+        count = len(entries)
+        size = sum(s for t, s, p in entries)
+        for mtime, s, path in entries:
+            if path == keep:
+                continue
+            if ((self._max_entries is None or count <= self._max_entries)
+                    and (self._max_size is None or size <= self._max_size)):
+                break
+            self._discard(path)
+            count -= 1
+            size -= s
+            self._evictions += 1
+
+    def clear(self):
+        r"""
+        Remove all stored gradings and reset the statistics.
+        """
+        for mtime, s, path in self._entries():
+            self._discard(path)
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+
+    def stats(self):
+        r"""
+        Return a dictionary of usage statistics of the cache.
+
+        The counts of hits, misses, stores and evictions are those of
+        this process. The number of entries and their total size in bytes
+        are read from the directory.
+        """
+        entries = self._entries()
+        return {'hits': self._hits,
+                'misses': self._misses,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'entries': len(entries),
+                'size': sum(s for t, s, p in entries)}
+
+
+def enable_maximal_grading_cache(directory, max_entries=None, max_size=None):
+    r"""
+    Enable caching the results of
+    :func:`~lie_gradings.gradings.grading.maximal_grading` on disk.
+
+    INPUT:
+
+    - ``directory`` -- a path to a directory to store the cache in
+    - ``max_entries`` -- (default:``None``) the maximum number of stored
+      gradings
+    - ``max_size`` -- (default:``None``) the maximum total size of stored
+      gradings in bytes
+
+    OUTPUT:
+
+    The enabled :class:`MaximalGradingCache`.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.cache import (enable_maximal_grading_cache,
+        ....:                                          disable_maximal_grading_cache)
+        sage: from lie_gradings.gradings.grading import maximal_grading
+        sage: cache = enable_maximal_grading_cache(tmp_dir())
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: gr = maximal_grading(L)
+        sage: maximal_grading(L) is gr
+        True
+        sage: cache.stats()['hits']
+        1
+        sage: disable_maximal_grading_cache()
+    """
+    global _active_cache
+    _active_cache = MaximalGradingCache(directory, max_entries=max_entries,
+                                        max_size=max_size)
+    return _active_cache
+
+
+def disable_maximal_grading_cache():
+    r"""
+    Disable caching the results of
+    :func:`~lie_gradings.gradings.grading.maximal_grading`.
+
+    The stored gradings are kept on disk.
+    """
+    global _active_cache
+    _active_cache = None
+
+
+def maximal_grading_cache():
+    r"""
+    Return the enabled :class:`MaximalGradingCache`, or ``None`` if caching
+    is not enabled.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.cache import maximal_grading_cache
+        sage: maximal_grading_cache() is None
+        True
+    """
+    return _active_cache
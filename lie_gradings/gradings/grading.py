@@ -1,20 +1,41 @@
-from itertools import combinations
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, islice
+from sage.algebras.lie_algebras.lie_algebra import LieAlgebra
 from sage.arith.functions import lcm
+from sage.combinat.posets.posets import Poset
+from sage.geometry.polyhedron.constructor import Polyhedron
 from sage.groups.additive_abelian.additive_abelian_group import AdditiveAbelianGroup
 from sage.matrix.constructor import matrix
 from sage.matrix.matrix_space import MatrixSpace
+from sage.misc.prandom import randint
 from sage.modules.free_module import FreeModule
 from sage.modules.free_module_element import vector
+from sage.rings.finite_rings.finite_field_constructor import GF
 from sage.rings.integer_ring import ZZ
+from sage.rings.rational_field import QQ
+from sage.rings.qqbar import QQbar, number_field_elements_from_algebraics
 from sage.structure.element import get_coercion_model
 
-from lie_gradings.gradings.utilities import jordan_decomposition
+from lie_gradings.gradings.cache import maximal_grading_cache
+from lie_gradings.gradings.profiling import _phase
+from lie_gradings.gradings.utilities import (derivations_basis,
+                                            _jordan_decomposition)
 from lie_gradings.gradings.lie_algebra_grading import grading
+from lie_gradings.gradings.records import GradingRecord
 
-__all__ = ['maximal_grading', 'torsion_free_gradings', 'stratification']
+__all__ = ['maximal_grading', 'modular_torus_data', 'torsion_free_gradings',
+           'iter_torsion_free_gradings', 'count_torsion_free_gradings',
+           'grading_refinement_poset', 'weight_automorphisms',
+           'stratification', 'clear_stratification_cache']
 
+# the maximal number of cached results of stratification
+STRATIFICATION_CACHE_SIZE = 256
+_stratification_cache = OrderedDict()
 
-def maximal_grading(L):
+
+def maximal_grading(L, number_field=False, rank=None):
     r"""
     Return a maximal grading of a Lie algebra defined over an
     algebraically closed field.
@@ -27,6 +48,27 @@ def maximal_grading(L):
     free abelian group `A` such that every `\mathfrak{g}_a` is contained
     in some `\mathfrak{g}_n`.
 
+    INPUT:
+
+    - ``L`` -- a Lie algebra
+    - ``number_field`` -- (default:``False``) a boolean; if ``True``, the
+      computation is done over an explicit number field containing the
+      structure coefficients, and the eigenvalues are computed in the
+      splitting field of the minimal polynomials of the torus. If this is
+      not possible, the computation falls back to the base ring of ``L``.
+
+    - ``rank`` -- (default:``None``) the expected rank of a maximal torus,
+      e.g., as predicted by :func:`modular_torus_data`; if given, the
+      search for a maximal torus stops as soon as a torus of this rank is
+      found, skipping the final check of the centralizer. If the given
+      rank is too small, the returned grading is not maximal.
+
+    If a cache has been enabled with
+    :func:`~lie_gradings.gradings.cache.enable_maximal_grading_cache`,
+    the result is looked up from and stored in the cache. Since the
+    result of a computation with a given ``rank`` is not guaranteed to
+    be maximal, the cache is not used when ``rank`` is given.
+
     EXAMPLES:
 
     A maximal grading of an abelian Lie algebra puts each basis element
@@ -68,8 +110,310 @@ def maximal_grading(L):
           (1, 0, 2) : (X_133,)
           (1, 1, 1) : (X_123, X_132)
           (2, 0, 1) : (X_113,)
+
+    For Lie algebras with algebraic structure coefficients, the linear
+    algebra can be done in a number field instead of with the slower
+    arithmetic of algebraic numbers::
+
+        sage: gr = maximal_grading(L, number_field=True)
+        sage: gr.has_equal_layers(maximal_grading(L))
+        True
+        sage: from lie_gradings.classification.dimension_7 import L147E
+        sage: L = L147E(QQbar, (1 + QQbar(-3).sqrt()) / 2)
+        sage: len(maximal_grading(L, number_field=True).magma().gens())
+        3
+
+    If the rank of a maximal torus is known, e.g. from a computation
+    modulo primes, the final check of maximality can be skipped::
+
+        sage: from lie_gradings.gradings.grading import modular_torus_data
+        sage: L = LieAlgebra(QQbar, 2, step=4)
+        sage: r, dims = modular_torus_data(L); r
+        2
+        sage: maximal_grading(L, rank=r).has_equal_layers(maximal_grading(L))
+        True
+
+    A too small rank gives a grading that is not maximal, so such
+    results are never cached::
+
+        sage: from lie_gradings.gradings.cache import (enable_maximal_grading_cache,
+        ....:                                          disable_maximal_grading_cache)
+        sage: cache = enable_maximal_grading_cache(tmp_dir())
+        sage: len(maximal_grading(L, rank=1).magma().gens())
+        1
+        sage: L in cache
+        False
+        sage: disable_maximal_grading_cache()
+    """
+    # a grading computed with an expected rank may not be maximal,
+    # so it must not be read from or written to the cache
+    cache = maximal_grading_cache() if rank is None else None
+    if cache is not None:
+        gr = cache.get(L)
+        if gr is not None:
+            return gr
+
+    gr = t = None
+    if number_field:
+        # None if the number fields cannot be constructed, in which case
+        # the computation falls back to linear algebra over the base ring
+        # reusing the torus if it was already computed
+        gr, t = _maximal_grading_number_field(L, rank=rank)
+    if gr is None:
+        if t is None:
+            t = _maximal_torus(L, rank=rank)
+        gr = _torus_grading(L, t)
+
+    if cache is not None:
+        cache.store(L, gr)
+    return gr
+
+
+def modular_torus_data(L, primes=None):
+    r"""
+    Return the rank of a maximal torus of derivations of ``L`` and the
+    dimensions of the layers of the maximal grading as predicted by
+    computations modulo primes.
+
+    The structure coefficients of ``L`` are reduced modulo each prime `p`
+    in ``primes``, and a maximal torus of the reduced Lie algebra over
+    `\mathrm{GF}(p)` is diagonalized over a finite extension. For large
+    primes, the rank and the layer dimensions coincide with those of the
+    maximal grading of ``L`` with high probability. The largest rank found
+    is returned, since a too small rank is the dangerous direction when
+    used as the ``rank`` argument of :func:`maximal_grading`.
+
+    INPUT:
+
+    - ``L`` -- a Lie algebra with rational or algebraic structure
+      coefficients
+    - ``primes`` -- (default:``None``) a list of primes to use; if
+      ``None``, three primes larger than `10^6` are used. Primes for
+      which the structure coefficients cannot be reduced are skipped.
+
+    OUTPUT:
+
+    A pair ``(k, dims)``, where ``k`` is the predicted rank and ``dims``
+    is the sorted list of predicted dimensions of the layers.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import modular_torus_data
+        sage: modular_torus_data(lie_algebras.Heisenberg(QQ, 1))
+        (2, [1, 1, 1])
+        sage: modular_torus_data(LieAlgebra(QQbar, 3, step=3))
+        (3, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2])
+
+    The prediction can be used as a cheap filter before computing
+    maximal gradings::
+
+        sage: from lie_gradings.classification.dimension_6 import L6_2
+        sage: modular_torus_data(L6_2(QQ))[0]
+        5
+    """
+    if primes is None:
+        primes = [1000003, 1000033, 1000037]
+
+    L_K, phi = _number_field_lie_algebra(L)
+    K = L_K.base_ring()
+    names = ['e%d' % i for i in range(L.dimension())]
+    sc_K = {}
+    for (x, y), v in L_K.structure_coefficients().items():
+        sc_K[(str(x), str(y))] = {str(z): c for z, c
+                                  in v.monomial_coefficients().items()}
+
+    best = None
+    for p in primes:
+        Fp = GF(p)
+        try:
+            if K is QQ:
+                def reduce_mod_p(c):
+                    return Fp(c)
+            else:
+                # reduce modulo a prime of degree one above p
+                roots = K.polynomial().change_ring(Fp).roots(multiplicities=False)
+                if not roots:
+                    continue
+                r = roots[0]
+
+                def reduce_mod_p(c):
+                    return c.polynomial().change_ring(Fp)(r)
+            sc_p = {xy: {z: reduce_mod_p(c) for z, c in v.items()}
+                    for xy, v in sc_K.items()}
+        except ZeroDivisionError:
+            # p divides a denominator
+            continue
+        L_p = LieAlgebra(Fp, sc_p, names=names)
+
+        t = _maximal_torus(L_p)
+        if not t:
+            dims = [L.dimension()]
+        else:
+            # diagonalize the torus over a splitting field
+            degrees = [h.degree() for A in t
+                       for h, e in A.minpoly().factor()]
+            F = GF(p ** lcm(degrees), 'z')
+            t_F = [A.change_ring(F) for A in t]
+            dims = sorted(V.dimension() for ev, V in _common_eigenspaces(t_F))
+
+        if best is None or len(t) > best[0]:
+            best = (len(t), dims)
+
+    if best is None:
+        raise ValueError("the structure coefficients of %s cannot be "
+                         "reduced modulo any of the primes %s" % (L, primes))
+    return best
+
+
+def _number_field_lie_algebra(L):
+    r"""
+    Return a copy of ``L`` defined over a number field containing all
+    the structure coefficients of ``L`` and the embedding of the number
+    field into the algebraic numbers.
+
+    The copy has the same ordering of the basis as ``L``.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _number_field_lie_algebra
+        sage: sc = {('X','Y'): {'Z': QQbar(2).sqrt()}}
+        sage: L.<X,Y,Z> = LieAlgebra(QQbar, sc)
+        sage: K, phi = _number_field_lie_algebra(L)
+        sage: K.base_ring().degree()
+        2
+        sage: K.dimension()
+        3
     """
+    keys = list(L.basis().keys())
+    names = ['e%d' % i for i in range(len(keys))]
+    index_names = dict(zip(keys, names))
+
+    brackets = []
+    for (x, y), v in L.structure_coefficients().items():
+        for z, c in v.monomial_coefficients().items():
+            brackets.append((index_names[x], index_names[y],
+                             index_names[z], QQbar(c)))
+    if not brackets:
+        K = QQ
+        phi = QQbar.coerce_map_from(QQ)
+        return LieAlgebra(K, {}, names=names), phi
+
+    K, coeffs, phi = number_field_elements_from_algebraics(
+        [c for x, y, z, c in brackets], minimal=True)
+    sc = {}
+    for (x, y, z, c), cK in zip(brackets, coeffs):
+        if (x, y) not in sc:
+            sc[(x, y)] = {}
+        sc[(x, y)][z] = cK
+    return LieAlgebra(K, sc, names=names), phi
+
+
+def _maximal_grading_number_field(L, rank=None):
+    r"""
+    Return a maximal grading of ``L`` computed over number fields.
+
+    A maximal torus is first computed over a number field containing the
+    structure coefficients. The eigenspaces of the torus are then
+    computed over a number field containing all the eigenvalues.
+
+    OUTPUT:
+
+    A pair ``(gr, t)``. If the computation succeeds, ``gr`` is a maximal
+    grading of ``L`` and ``t`` is ``None``.
 
+    Otherwise ``gr`` is ``None``. This happens if the structure
+    coefficients or the eigenvalues cannot be represented in a number
+    field, or if the number field of the eigenvalues does not embed into
+    the base ring of ``L``. If the maximal torus was already computed, it
+    is returned as ``t`` as a list of matrices over the base ring of
+    ``L``, so that the caller does not need to compute it again.
+    Otherwise ``t`` is ``None``.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _maximal_grading_number_field
+        sage: L = lie_algebras.Heisenberg(QQbar, 1)
+        sage: gr, t = _maximal_grading_number_field(L)
+        sage: t is None
+        True
+        sage: gr.magma()
+        Additive abelian group isomorphic to Z + Z
+        sage: gr.lie_algebra() is L
+        True
+    """
+    try:
+        L_K, phi = _number_field_lie_algebra(L)
+    except (NotImplementedError, TypeError, ValueError):
+        # the structure coefficients are not algebraic numbers
+        return None, None
+    t = _maximal_torus(L_K, rank=rank)
+    if not t:
+        return _torus_grading(L, t), None
+
+    # find a number field containing the entries and all the eigenvalues
+    # of the torus, so that the torus is diagonalizable over the field
+    n = L.dimension()
+    entries = [phi(x) for A in t for x in A.list()]
+    eigenvalues = []
+    for A in t:
+        f = A.minpoly().map_coefficients(phi, QQbar)
+        eigenvalues.extend(f.roots(multiplicities=False))
+    try:
+        F, elems, psi = number_field_elements_from_algebraics(
+            entries + eigenvalues, minimal=True)
+    except (NotImplementedError, ValueError):
+        return None, _torus_to_base_ring(L, t, phi)
+
+    # the eigenvectors are mapped back to the base ring of L, which is
+    # possible for all of F if it is possible for its generator
+    try:
+        L.base_ring()(psi(F.gen()))
+    except (TypeError, ValueError):
+        return None, _torus_to_base_ring(L, t, phi)
+
+    t_F = [matrix(F, n, n, elems[i * n * n:(i + 1) * n * n])
+           for i in range(len(t))]
+    return _torus_grading(L, t_F, to_base_ring=psi), None
+
+
+def _torus_to_base_ring(L, t, phi):
+    r"""
+    Return the matrices of the torus ``t`` over a number field mapped to
+    the base ring of ``L`` by the embedding ``phi``, or ``None`` if some
+    entry is not in the base ring of ``L``.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import (_maximal_torus,
+        ....:     _number_field_lie_algebra, _torus_to_base_ring)
+        sage: L = lie_algebras.Heisenberg(QQbar, 1)
+        sage: L_K, phi = _number_field_lie_algebra(L)
+        sage: t = _torus_to_base_ring(L, _maximal_torus(L_K), phi)
+        sage: len(t), t[0].base_ring()
+        (2, Algebraic Field)
+    """
+    R = L.base_ring()
+    try:
+        return [A.apply_map(lambda x: R(phi(x)), R) for A in t]
+    except (TypeError, ValueError):
+        return None
+
+
+def _maximal_torus(L, rank=None):
+    r"""
+    Return a basis of a maximal torus of derivations of ``L`` as a list
+    of matrices over the base ring of ``L``.
+
+    If ``rank`` is given, the search stops once a torus of rank ``rank``
+    is found.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _maximal_torus
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: len(_maximal_torus(L))
+        2
+    """
     # define utilities to convert from matrices to vectors and back
     R = L.base_ring()
     n = L.dimension()
@@ -78,48 +422,80 @@ def maximal_grading(L):
     def matrix_to_vec(A):
         return vector(R, sum((list(Ar) for Ar in A.rows()), []))
 
-    db = L.derivations_basis()
+    with _phase('derivations_basis'):
+        db = derivations_basis(L)
 
     def derivation_lincomb(vec):
         return sum((vk * dk for vk, dk in zip(vec, db)), MS.zero())
 
     # iteratively construct larger and larger tori of derivations
+    # the centralizer of the current torus is maintained incrementally:
+    # each new torus element only cuts the previous centralizer down by
+    # the kernel of its adjoint map
+    gl = FreeModule(R, n * n)
     t = []
+    t_submodule = gl.zero_submodule()
+    ker = FreeModule(R, len(db))
+    cb = list(db)
+    # the polynomials of the Jordan decompositions are shared by the
+    # many centralizer elements with equal minimal polynomials
+    polys = {}
     while True:
-        # compute the centralizer of the torus in the derivation algebra
-        ker = FreeModule(R, len(db))
-        for der in t:
-            # form the matrix of ad(der) with rows
-            # the images of basis derivations
-            A = matrix([matrix_to_vec(der * X - X * der) for X in db])
-            ker = ker.intersection(A.left_kernel())
-        cb = [derivation_lincomb(v) for v in ker.basis()]
-
         # check the basis of the centralizer for semisimple parts outside of t
-        gl = FreeModule(R, n * n)
-        t_submodule = gl.submodule([matrix_to_vec(der) for der in t])
         for A in cb:
-            As, An = jordan_decomposition(A)
-            if matrix_to_vec(As) not in t_submodule:
+            with _phase('jordan_decomposition'):
+                As, An = _jordan_decomposition(A, polys)
+            As_vec = matrix_to_vec(As)
+            if As_vec not in t_submodule:
                 # extend the torus by As
                 t.append(As)
+                t_submodule = t_submodule + gl.submodule([As_vec])
                 break
         else:
             # no new elements found, so the torus is maximal
             break
 
-    # compute the eigenspace intersections to get the concrete grading
-    common_eigenspaces = [([], FreeModule(R, n))]
-    for A in t:
-        new_eigenspaces = []
-        eig = A.right_eigenspaces()
-        for ev, V in common_eigenspaces:
-            for ew, W in eig:
-                VW = V.intersection(W)
-                if VW.dimension() > 0:
-                    new_eigenspaces.append((ev + [ew], VW))
-        common_eigenspaces = new_eigenspaces
+        if rank is not None and len(t) >= rank:
+            # the expected rank is reached
+            break
+
+        # restrict the centralizer to the kernel of ad(As): form the matrix
+        # with rows the images of the current centralizer basis
+        with _phase('centralizer'):
+            A = matrix(R, [matrix_to_vec(As * X - X * As) for X in cb])
+            K = ker.basis_matrix()
+            ker = ker.submodule([v * K for v in A.left_kernel().basis()])
+            cb = [derivation_lincomb(v) for v in ker.basis()]
+
+    return t
 
+
+def _torus_grading(L, t, to_base_ring=None):
+    r"""
+    Return the grading of ``L`` over `\mathbb{Z}^k` defined by the
+    simultaneous eigenspaces of the torus ``t``.
+
+    INPUT:
+
+    - ``L`` -- a Lie algebra
+    - ``t`` -- a list of commuting semisimple matrices
+    - ``to_base_ring`` -- (default:``None``) a map from the base ring
+      of the matrices of ``t`` to the base ring of ``L``; if ``None``,
+      the matrices are assumed to be defined over the base ring of ``L``
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _torus_grading
+        sage: L.<X,Y,Z> = LieAlgebra(QQ, {('X','Y'): {'Z': 1}})
+        sage: D = matrix.diagonal(QQ, [1, 2, 3])
+        sage: _torus_grading(L, [D])
+        Grading over Additive abelian group isomorphic to Z + Z of Lie
+        algebra on 3 generators (X, Y, Z) over Rational Field with
+        nonzero layers
+          (1, 0) : (X,)
+          (0, 1) : (Y,)
+          (1, 1) : (Z,)
+    """
     if not t:
         # zero dimensional maximal torus
         # the only grading is the trivial grading
@@ -127,25 +503,493 @@ def maximal_grading(L):
         layers = {magma.zero():L.basis().list()}
         return grading(L, layers, magma=magma)
 
+    if to_base_ring is None:
+        to_element = L.from_vector
+    else:
+        def to_element(v):
+            return L.from_vector(vector(L.base_ring(),
+                                        [to_base_ring(vi) for vi in v]))
+
+    # compute the common eigenspaces to get the concrete grading
+    with _phase('eigenspaces'):
+        common_eigenspaces = _common_eigenspaces(t)
+
     # define a grading with layers indexed by tuples of eigenvalues
     cm = get_coercion_model()
     all_eigenvalues = sum((ev for ev, V in common_eigenspaces), [])
     k = len(common_eigenspaces[0][0])
     evR = cm.common_parent(*all_eigenvalues)
-    layers = {tuple(ev):[L.from_vector(v) for v in V.basis()]
+    layers = {tuple(ev):[to_element(v) for v in V.basis()]
                         for ev, V in common_eigenspaces}
     magma = evR.cartesian_product(*[evR] * (k - 1))
     gr = grading(L, layers, magma=magma)
 
     # convert to a grading over Z^k
-    return gr.universal_realization()
+    with _phase('universal_realization'):
+        return gr.universal_realization()
+
+
+def _common_eigenspaces(t):
+    r"""
+    Return the common eigenspaces of a list of commuting semisimple
+    matrices.
+
+    A random linear combination of the matrices is diagonalized, and the
+    eigenvalues of each of the matrices are read off from the eigenvectors
+    of the combination. If the combination is not generic, i.e., some of
+    its eigenspaces are not common eigenspaces, a new combination with
+    larger coefficients is tried.
+
+    INPUT:
+
+    - ``t`` -- a nonempty list of commuting semisimple matrices
+
+    OUTPUT:
+
+    A list of pairs ``(ev, V)``, where ``V`` is a common eigenspace and
+    ``ev`` is the list of eigenvalues of the matrices on ``V``.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _common_eigenspaces
+        sage: A = matrix.diagonal(QQ, [1, 1, 2])
+        sage: B = matrix.diagonal(QQ, [0, 1, 1])
+        sage: sorted((ev, V.dimension()) for ev, V in _common_eigenspaces([A, B]))
+        [([1, 0], 1), ([1, 1], 1), ([2, 1], 1)]
+    """
+    n = t[0].nrows()
+    bound = 1
+    while True:
+        coeffs = [randint(1, bound) for T in t]
+        A = sum((c * T for c, T in zip(coeffs, t)), 0 * t[0])
+
+        common_eigenspaces = []
+        for ew, W in A.right_eigenspaces():
+            B = W.basis_matrix().transpose()
+            v = B.column(0)
+            i = next(i for i, vi in enumerate(v) if vi)
+            ev = []
+            for T in t:
+                TB = T * B
+                eig = TB[i, 0] / v[i]
+                if TB != eig * B:
+                    # the combination did not separate all common eigenspaces
+                    break
+                ev.append(eig)
+            else:
+                common_eigenspaces.append((ev, W))
+                continue
+            break
+        else:
+            return common_eigenspaces
+
+        bound = 2 * bound + n
+
+
+def weight_automorphisms(gr):
+    r"""
+    Return weight automorphisms of a grading over `\mathbb{Z}^k` induced
+    by automorphisms of the Lie algebra.
+
+    A weight automorphism is an automorphism `g` of the lattice
+    `\mathbb{Z}^k` permuting the nonzero weights of the grading such
+    that there exists an automorphism `\Phi` of the Lie algebra with
+    `\Phi(\mathfrak{g}_a) = \mathfrak{g}_{g(a)}` for all weights `a`.
+    Gradings identified by weight automorphisms are therefore isomorphic.
+
+    The candidates are first found combinatorially as the lattice
+    automorphisms preserving the dimensions of the layers and the pairs
+    of layers with nonzero brackets. A candidate is kept only if it
+    lifts to an automorphism `\Phi` mapping the `i`-th element of each
+    layer `\mathfrak{g}_a` to a nonzero multiple of the `i`-th element
+    of `\mathfrak{g}_{g(a)}`. This is a sufficient condition for the
+    existence of a lift, so for layers of dimension larger than one some
+    weight automorphisms may be missed, but all returned ones are
+    induced by automorphisms of the Lie algebra. The returned
+    automorphisms form a group.
+
+    INPUT:
+
+    - ``gr`` -- a grading over `\mathbb{Z}^k`
+
+    OUTPUT:
+
+    The list of weight automorphisms as integer matrices acting on
+    column vectors, starting with the identity. If the weights do not
+    span `\mathbb{Q}^k`, only the identity is returned.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import (maximal_grading,
+        ....:                                            weight_automorphisms)
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: weight_automorphisms(maximal_grading(L))
+        [
+        [1 0]  [0 1]
+        [0 1], [1 0]
+        ]
+        sage: L = LieAlgebra(QQ, 3, step=2)
+        sage: len(weight_automorphisms(maximal_grading(L)))
+        6
+
+    The permutations of the generators `X_1, X_2, X_3` of the Lie
+    algebras `L_{147E}(a)` preserve the weight data of the maximal
+    grading, but map the parameter `a` to `1/a`, `1-a` etc., so they
+    lift to automorphisms only for special parameters::
+
+        sage: from lie_gradings.classification.dimension_7 import L147E
+        sage: len(weight_automorphisms(maximal_grading(L147E(QQ, 3))))
+        1
+        sage: len(weight_automorphisms(maximal_grading(L147E(QQ, -1))))
+        2
+    """
+    layers = gr.layers()
+    weights = list(layers)
+    vecs = [vector(ZZ, tuple(a)) for a in weights]
+    k = len(gr.magma().gens())
+    identity = matrix.identity(ZZ, k)
+    index = {tuple(v): i for i, v in enumerate(vecs)}
+    dims = [len(layers[a]) for a in weights]
+    support = set((i, j) for i, a in enumerate(weights)
+                  for j, b in enumerate(weights)
+                  if any(X.bracket(Y) for X in layers[a] for Y in layers[b]))
+
+    # a basis of Q^k among the weights
+    basis = []
+    for i, v in enumerate(vecs):
+        if matrix(QQ, [vecs[j] for j in basis] + [v]).rank() > len(basis):
+            basis.append(i)
+    if len(basis) < k:
+        return [identity]
+    Binv = matrix(QQ, [vecs[i] for i in basis]).transpose().inverse()
+    positions, brackets = _adapted_structure_constants(layers, weights)
+
+    # choose images of the basis weights compatible with the dimensions
+    # and the brackets among the basis weights
+    group = []
+
+    def extend(images):
+        m = len(images)
+        if m == k:
+            C = matrix(QQ, [vecs[j] for j in images]).transpose()
+            g = C * Binv
+            if not all(gij in ZZ for gij in g.list()) or g.det() not in [1, -1]:
+                return
+            g = g.change_ring(ZZ)
+            perm = [index.get(tuple(g * v)) for v in vecs]
+            if any(pi is None for pi in perm):
+                return
+            if any(dims[pi] != di for pi, di in zip(perm, dims)):
+                return
+            if any(((i, j) in support) != ((perm[i], perm[j]) in support)
+                   for i in range(len(vecs)) for j in range(len(vecs))):
+                return
+            if not _lifts_to_automorphism(perm, positions, brackets):
+                return
+            g.set_immutable()
+            group.append(g)
+            return
+
+        i = basis[m]
+        for j in range(len(vecs)):
+            if j in images or dims[j] != dims[i]:
+                continue
+            new_images = images + [j]
+            if any(((basis[a], basis[b]) in support)
+                   != ((new_images[a], new_images[b]) in support)
+                   for a in range(m + 1) for b in range(m + 1)):
+                continue
+            extend(new_images)
+
+    extend([])
+    group.sort(key=lambda g: g != identity)
+    return group
+
+
+def _adapted_structure_constants(layers, weights):
+    r"""
+    Return the structure coefficients of a graded Lie algebra in the
+    basis formed by the elements of its layers.
+
+    INPUT:
+
+    - ``layers`` -- a dictionary of the layers of a grading
+    - ``weights`` -- a list of the weights of the grading
+
+    OUTPUT:
+
+    A pair ``(positions, brackets)``, where ``positions[w]`` is the list
+    of the indices in the adapted basis of the elements of the layer of
+    ``weights[w]``, and ``brackets`` is a dictionary mapping pairs
+    ``(i, j)`` with ``i < j`` to dictionaries ``{k: c}`` of the nonzero
+    coefficients of the bracket of the ``i``-th and ``j``-th basis
+    elements.
 
+    EXAMPLES::
 
-def torsion_free_gradings(L):
+        sage: from lie_gradings.gradings.grading import _adapted_structure_constants
+        sage: L.<X,Y,Z> = LieAlgebra(QQ, {('X','Y'): {'Z': 1}})
+        sage: layers = {1: [X + Y, Y], 2: [2*Z]}
+        sage: _adapted_structure_constants(layers, [1, 2])
+        ([[0, 1], [2]], {(0, 1): {2: 1/2}})
+    """
+    basis = []
+    positions = []
+    for a in weights:
+        positions.append(list(range(len(basis), len(basis) + len(layers[a]))))
+        basis.extend(layers[a])
+    if not basis:
+        return positions, {}
+    R = basis[0].parent().base_ring()
+    Cinv = matrix(R, [X.to_vector() for X in basis]).inverse()
+    brackets = {}
+    for i, j in combinations(range(len(basis)), 2):
+        v = basis[i].bracket(basis[j]).to_vector() * Cinv
+        coeffs = {k: c for k, c in enumerate(v) if c}
+        if coeffs:
+            brackets[(i, j)] = coeffs
+    return positions, brackets
+
+
+def _lifts_to_automorphism(perm, positions, brackets):
+    r"""
+    Return whether a permutation of the layers of a grading lifts to an
+    automorphism of the Lie algebra scaling the elements of the adapted
+    basis.
+
+    The permutation ``perm`` of the weights defines the permutation
+    `\sigma` of the adapted basis `e_1,\ldots,e_n` mapping the
+    ``i``-th element of each layer to the ``i``-th element of the image
+    layer. A linear map `\Phi(e_i) = c_ie_{\sigma(i)}` with nonzero
+    scalars `c_i` is an automorphism if and only if `\sigma` preserves
+    the support of the structure coefficients `s_{ij}^k` and
+
+    .. MATH::
+
+        c_ic_jc_k^{-1} = s_{ij}^k / s_{\sigma(i)\sigma(j)}^{\sigma(k)}
+
+    for all nonzero `s_{ij}^k`. Over an algebraically closed field, such a
+    system of binomial equations has a solution if and only if the right
+    hand sides satisfy every multiplicative relation of the left hand
+    sides, which is checked on a basis of the integer relations.
+
+    INPUT:
+
+    - ``perm`` -- a list of the indices of the images of the weights
+    - ``positions``, ``brackets`` -- the output of
+      :func:`_adapted_structure_constants`
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import (_adapted_structure_constants,
+        ....:                                            _lifts_to_automorphism)
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: p1, q1, z = L.basis()
+        sage: positions, brackets = _adapted_structure_constants(
+        ....:     {(1, 0): [p1], (0, 1): [q1], (1, 1): [z]},
+        ....:     [(1, 0), (0, 1), (1, 1)])
+        sage: _lifts_to_automorphism([1, 0, 2], positions, brackets)
+        True
+    """
+    n = sum(len(pos) for pos in positions)
+    sigma = [None] * n
+    for w, pos in enumerate(positions):
+        for i, j in zip(pos, positions[perm[w]]):
+            sigma[i] = j
+
+    def coefficient(i, j, k):
+        # the structure coefficient s_{ij}^k using antisymmetry
+        if i < j:
+            return brackets.get((i, j), {}).get(k, 0)
+        return -brackets.get((j, i), {}).get(k, 0)
+
+    rows = []
+    rhs = []
+    for (i, j), coeffs in brackets.items():
+        for k, c in coeffs.items():
+            t = coefficient(sigma[i], sigma[j], sigma[k])
+            if not t:
+                return False
+            row = [0] * n
+            row[i] += 1
+            row[j] += 1
+            row[k] -= 1
+            rows.append(row)
+            rhs.append(c / t)
+    # every nonzero coefficient maps to a nonzero coefficient and sigma
+    # is a bijection, so the support is preserved
+    if not rows:
+        return True
+
+    for u in matrix(ZZ, rows).left_kernel().basis():
+        value = 1
+        for ui, r in zip(u, rhs):
+            if ui:
+                value *= r ** ui
+        if value != 1:
+            return False
+    return True
+
+
+def _arrangement_flats(vectors, k, group=None, max_rank=None, accept=None,
+                       relations=None):
+    r"""
+    Return the flats of the arrangement of the integer vectors
+    ``vectors`` in `\mathbb{Q}^k`.
+
+    A flat is the set of all the vectors of the arrangement contained in
+    some subspace spanned by vectors of the arrangement. The flats are
+    generated by increasing rank, each flat of rank `r+1` as the closure
+    of a flat of rank `r` and a single vector outside it, so every flat
+    is constructed once from each of its covered flats instead of once
+    from every spanning subset.
+
+    INPUT:
+
+    - ``vectors`` -- an iterable of integer vectors as tuples
+    - ``k`` -- the length of the vectors
+    - ``group`` -- (default:``None``) a list of the elements of a group
+      of integer matrices mapping the arrangement to itself up to signs
+      of the vectors, where the identity may be omitted; if given, only
+      one flat of each orbit of the group is generated
+    - ``max_rank`` -- (default:``None``) if given, only flats of rank at
+      most ``max_rank`` are generated
+    - ``accept`` -- (default:``None``) a function of a flat returning a
+      boolean; if given, flats for which it returns ``False`` are neither
+      returned nor extended to flats of larger rank. The function should
+      be monotone, i.e., return ``False`` for all flats containing a
+      rejected flat.
+    - ``relations`` -- (default:``None``) a list; if given, the pairs
+      ``(i, j)`` such that the ``i``-th generated flat is covered by the
+      ``j``-th generated flat are appended to the list as they are found
+
+    OUTPUT:
+
+    An iterator of flats, each flat a list of vectors in the order of
+    ``vectors``, by increasing rank.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _arrangement_flats
+        sage: list(_arrangement_flats([(1, 0), (0, 1), (1, 1)], 2))
+        [[], [(1, 0)], [(0, 1)], [(1, 1)], [(1, 0), (0, 1), (1, 1)]]
+        sage: vecs = [(1, 0, 0), (0, 1, 0), (1, 1, 0), (0, 0, 1)]
+        sage: [len(F) for F in _arrangement_flats(vecs, 3)]
+        [0, 1, 1, 1, 1, 3, 2, 2, 2, 4]
+
+    Swapping the first two coordinates identifies pairs of flats::
+
+        sage: g = matrix(ZZ, [[0, 1, 0], [1, 0, 0], [0, 0, 1]])
+        sage: [len(F) for F in _arrangement_flats(vecs, 3, group=[g])]
+        [0, 1, 1, 1, 3, 2, 2, 4]
+
+    The search may be restricted by rank and by a monotone predicate::
+
+        sage: [len(F) for F in _arrangement_flats(vecs, 3, max_rank=1)]
+        [0, 1, 1, 1, 1]
+        sage: no_d = lambda F: (0, 0, 1) not in F
+        sage: [len(F) for F in _arrangement_flats(vecs, 3, accept=no_d)]
+        [0, 1, 1, 1, 3]
+
+    The cover relations between the flats are found along the way::
+
+        sage: rels = []
+        sage: flats = list(_arrangement_flats([(1, 0), (0, 1), (1, 1)], 2,
+        ....:                                 relations=rels))
+        sage: sorted(set(rels))
+        [(0, 1), (0, 2), (0, 3), (1, 4), (2, 4), (3, 4)]
+    """
+    vectors = list(vectors)
+    VQ = FreeModule(QQ, k)
+
+    def line(v):
+        # normalize the sign of a vector to identify the line it spans
+        v = tuple(v)
+        if next(vi for vi in v if vi) < 0:
+            v = tuple(-vi for vi in v)
+        return v
+
+    # the lines of the arrangement indexed by first occurrence
+    line_index = {}
+    for v in vectors:
+        line_index.setdefault(line(v), len(line_index))
+    lines = [line_index[line(v)] for v in vectors]
+    if group is not None:
+        # the permutations of the lines defined by the group
+        line_perms = [list(range(len(line_index)))]
+        for g in group:
+            perm = [None] * len(line_index)
+            for v, i in line_index.items():
+                perm[i] = line_index[line(g * vector(ZZ, v))]
+            line_perms.append(perm)
+
+    def key(F):
+        # a key identifying the flat, or its orbit if a group is given
+        ls = frozenset(lines[j] for j in F)
+        if group is None:
+            return ls
+        return min(tuple(sorted(perm[i] for i in ls)) for perm in line_perms)
+
+    if accept is not None and not accept([]):
+        return
+    # the indices of the generated flats by key
+    seen = {key(frozenset()): 0}
+    count = 1
+    layer = [frozenset()]
+    yield []
+    rank = 0
+    while layer:
+        rank += 1
+        if max_rank is not None and rank > max_rank:
+            return
+        next_layer = []
+        for F in layer:
+            for i, v in enumerate(vectors):
+                if i in F:
+                    continue
+                S = VQ.subspace([vectors[j] for j in F] + [v])
+                G = frozenset(j for j, u in enumerate(vectors)
+                              if j in F or j == i or VQ(u) in S)
+                G_key = key(G)
+                if G_key not in seen:
+                    G_vectors = [vectors[j] for j in sorted(G)]
+                    if accept is not None and not accept(G_vectors):
+                        seen[G_key] = None
+                        continue
+                    seen[G_key] = count
+                    count += 1
+                    next_layer.append(G)
+                    if relations is not None:
+                        relations.append((seen[key(F)], seen[G_key]))
+                    yield G_vectors
+                elif relations is not None and seen[G_key] is not None:
+                    relations.append((seen[key(F)], seen[G_key]))
+        layer = next_layer
+
+
+def torsion_free_gradings(L, processes=1, symmetry=False, **filters):
     r"""
     Return a complete list of gradings of the Lie algebra over torsion
     free abelian groups.
 
+    See :func:`iter_torsion_free_gradings` for an iterator over the same
+    gradings.
+
+    INPUT:
+
+    - ``L`` -- a Lie algebra
+    - ``processes`` -- (default:``1``) the number of worker processes
+      computing the quotients; if ``None``, the number of processors of
+      the machine is used
+    - ``symmetry`` -- (default:``False``) a boolean; if ``True``, only
+      one grading is listed for each orbit of the weight automorphisms
+      of the maximal grading, see :func:`weight_automorphisms`. The
+      weight automorphisms are induced by automorphisms of the Lie
+      algebra, so only isomorphic gradings are identified.
+    - ``filters`` -- the filters ``min_rank``, ``max_rank``, ``label``,
+      ``positive``, ``min_layers`` and ``max_layers`` of
+      :func:`iter_torsion_free_gradings`
+
     The list is guaranteed to be complete in the following sense:
     If `\mathfrak{g} = \bigoplus_{a\in A} \mathfrak{g}_a` is any grading
     of the Lie algebra `\mathfrak{g}` over a torsion free abelian group
@@ -157,6 +1001,9 @@ def torsion_free_gradings(L):
     is exactly the same as the original `A`-grading.
     However, the list is not guaranteed to be reduced up to
     automorphism, so the above choices are not in general unique.
+    With ``symmetry=True`` the list is still complete in the above
+    sense, since a grading is only omitted if it is the image of a
+    listed grading under an automorphism of the Lie algebra.
 
     EXAMPLES:
 
@@ -186,47 +1033,582 @@ def torsion_free_gradings(L):
          Grading over Trivial group of Heisenberg algebra of rank 1 over Rational Field with nonzero layers
            () : (p1, q1, z)
          ]
+
+    The two gradings with layers `\langle p_1, z\rangle` and
+    `\langle q_1, z\rangle` in degree `1` are exchanged by swapping `p_1`
+    and `q_1`. Reducing by the weight automorphisms lists only one of
+    them::
+
+        sage: len(torsion_free_gradings(L, symmetry=True))
+        4
+
+    All positive gradings of rank at least `2`::
+
+        sage: torsion_free_gradings(L, positive=True, min_rank=2)
+        [Grading over Additive abelian group isomorphic to Z + Z of Heisenberg algebra of rank 1 over Rational Field with nonzero layers
+           (1, 0) : (p1,)
+           (0, 1) : (q1,)
+           (1, 1) : (z,)
+         ]
+    """
+    return list(iter_torsion_free_gradings(L, processes=processes,
+                                           symmetry=symmetry, **filters))
+
+
+def iter_torsion_free_gradings(L, limit=None, processes=1, symmetry=False,
+                               records=False, min_rank=None, max_rank=None,
+                               label=None, positive=False, min_layers=None,
+                               max_layers=None):
+    r"""
+    Iterate over a complete list of gradings of the Lie algebra over
+    torsion free abelian groups.
+
+    The gradings are the same as the ones returned by
+    :func:`torsion_free_gradings`, in the same order, but each grading is
+    yielded as soon as it is constructed.
+
+    INPUT:
+
+    - ``L`` -- a Lie algebra
+    - ``limit`` -- (default:``None``) the maximal number of gradings to
+      yield; if ``None``, all gradings are yielded
+    - ``processes`` -- (default:``1``) the number of worker processes
+      computing the quotients; if ``None``, the number of processors of
+      the machine is used, and if ``1``, the computations are done in
+      the current process
+    - ``symmetry`` -- (default:``False``) a boolean; if ``True``, only
+      one grading is yielded for each orbit of the weight automorphisms
+      of the maximal grading, see :func:`weight_automorphisms`. The
+      weight automorphisms are induced by automorphisms of the Lie
+      algebra, so only isomorphic gradings are identified.
+    - ``records`` -- (default:``False``) a boolean; if ``True``, yield
+      compact :class:`~lie_gradings.gradings.records.GradingRecord`
+      objects constructing the gradings only on demand; otherwise the
+      gradings are constructed with
+      :meth:`~lie_gradings.gradings.records.GradingRecord.grading`,
+      skipping the checks that hold for all projections of gradings
+
+    The following filters restrict the gradings. They are applied to the
+    weight data during the enumeration, so that rejected gradings are
+    never constructed:
+
+    - ``min_rank``, ``max_rank`` -- (default:``None``) bounds for the
+      rank of the grading group
+    - ``label`` -- (default:``None``) the type of the gradings as a
+      string ``k.n_1n_2...``, where ``k`` is the rank of the grading
+      group and ``n_i`` is the number of ``i``-dimensional layers
+    - ``positive`` -- (default:``False``) a boolean; if ``True``, only
+      gradings with a positive realization are enumerated
+    - ``min_layers``, ``max_layers`` -- (default:``None``) bounds for
+      the number of nonzero layers
+
+    Merging layers never increases the number of layers or makes a
+    grading positive, so the minimal rank, the minimal number of layers
+    and the positivity prune whole branches of the enumeration.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import iter_torsion_free_gradings
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: it = iter_torsion_free_gradings(L)
+        sage: next(it)
+        Grading over Additive abelian group isomorphic to Z + Z of Heisenberg
+        algebra of rank 1 over Rational Field with nonzero layers
+          (1, 0) : (p1,)
+          (0, 1) : (q1,)
+          (1, 1) : (z,)
+        sage: len(list(iter_torsion_free_gradings(L, limit=3)))
+        3
+
+    The quotients may be computed in parallel, keeping the same order::
+
+        sage: L = LieAlgebra(QQ, 3, step=2)
+        sage: grs = list(iter_torsion_free_gradings(L, processes=2))
+        sage: grs == list(iter_torsion_free_gradings(L))
+        True
+
+    Records describe the gradings as projections of the maximal grading::
+
+        sage: recs = list(iter_torsion_free_gradings(L, records=True))
+        sage: recs[0].rank(), recs[-1].rank()
+        (3, 0)
+        sage: all(rec.grading().has_equal_layers(gr) for rec, gr in zip(recs, grs))
+        True
+
+    Filters select gradings during the enumeration::
+
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: [gr.has_positive_realization()
+        ....:  for gr in iter_torsion_free_gradings(L, positive=True)]
+        [True, True]
+        sage: [rec.label() for rec in iter_torsion_free_gradings(L, records=True,
+        ....:                                                     label='1.11')]
+        ['1.11', '1.11', '1.11']
+        sage: len(list(iter_torsion_free_gradings(L, min_layers=3)))
+        1
+        sage: len(list(iter_torsion_free_gradings(L, max_rank=1, min_rank=1)))
+        3
     """
+    if limit is not None and limit <= 0:
+        return
+
     maxgrading = maximal_grading(L)
     V = FreeModule(ZZ, len(maxgrading.magma().gens()))
     weights = maxgrading.layers().keys()
 
     # The torsion-free gradings are enumerated by torsion-free quotients
     # of the grading group of the maximal grading.
+    # Every quotient is determined by the flat of the arrangement of
+    # weight differences spanning the kernel, and the kernel is the
+    # saturated sublattice of the rational span of the flat.
     diffset = set([tuple(b - a) for a, b in combinations(weights, 2)])
-    subspaces = []
-    for d in range(len(diffset) + 1):
-        for B in combinations(diffset, d):
-            W = V.submodule(B)
-            if W not in subspaces:
-                subspaces.append(W)
+    group = None
+    if symmetry:
+        group = weight_automorphisms(maxgrading)
+    k = V.rank()
+    weight_vectors = [tuple(n) for n in weights]
+    dims = [len(maxgrading.layers()[n]) for n in weights]
+
+    if label is not None:
+        # the type determines the rank and the number of layers
+        label_rank, counts = label.split('.')
+        label_rank = int(label_rank)
+        label_layers = sum(int(c) for c in counts)
+        min_rank = max(min_rank or 0, label_rank)
+        max_rank = label_rank if max_rank is None else min(max_rank, label_rank)
+        min_layers = max(min_layers or 0, label_layers)
+        max_layers = (label_layers if max_layers is None
+                      else min(max_layers, label_layers))
+
+    def accept(F):
+        # monotone conditions pruning the enumeration
+        if min_layers is not None:
+            if len(_flat_layer_dimensions(weight_vectors, dims, F)) < min_layers:
+                return False
+        if positive:
+            # the grading is positive iff zero is not in the convex
+            # hull of the projected weights
+            if k == 0:
+                return False
+            P = Polyhedron(vertices=weight_vectors, lines=F)
+            if P.contains([0] * k):
+                return False
+        return True
+
+    def keep(F):
+        # conditions on the yielded gradings
+        rank = k - (matrix(QQ, F).rank() if F else 0)
+        if max_rank is not None and rank > max_rank:
+            return False
+        if max_layers is None and label is None:
+            return True
+        F_dims = _flat_layer_dimensions(weight_vectors, dims, F)
+        if max_layers is not None and len(F_dims) > max_layers:
+            return False
+        if label is not None:
+            F_label = "%d." % rank + "".join(str(F_dims.count(d))
+                                             for d in range(1, max(F_dims) + 1))
+            if F_label != label:
+                return False
+        return True
+
+    max_flat_rank = None
+    if min_rank is not None:
+        max_flat_rank = k - min_rank
+    flats = _arrangement_flats(diffset, k, group=group, max_rank=max_flat_rank,
+                               accept=accept)
+    flats = (F for F in flats if keep(F))
 
     # for each subspace, define the quotient grading
-    projected_gradings = []
-    for W in subspaces:
-        Q = V.quotient(W)
+    if processes == 1:
+        projections = _iter_quotient_projections(k, weight_vectors, flats)
+    else:
+        projections = _iter_quotient_projections_parallel(
+            k, weight_vectors, flats, processes)
+
+    count = 0
+    try:
+        for invariants, proj in projections:
+            record = GradingRecord(maxgrading, len(invariants), proj)
+            if records:
+                yield record
+            else:
+                # a projection of a grading is a grading, so the
+                # checks of the grading properties are skipped
+                yield record.grading()
+
+            count += 1
+            if limit is not None and count >= limit:
+                return
+    finally:
+        projections.close()
+
+
+def _flat_layer_dimensions(weights, dims, F):
+    r"""
+    Return the sorted dimensions of the layers of the quotient of a
+    grading by the span of the flat ``F`` of its weight differences.
+
+    Two weights are in the same layer of the quotient if and only if
+    their difference is in the span of the flat, i.e., if the difference
+    or its negative is a vector of the flat.
+
+    INPUT:
+
+    - ``weights`` -- a list of weights as integer tuples
+    - ``dims`` -- the list of dimensions of the layers of the weights
+    - ``F`` -- a list of weight differences as integer tuples
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _flat_layer_dimensions
+        sage: weights = [(1, 0), (0, 1), (1, 1)]
+        sage: _flat_layer_dimensions(weights, [1, 1, 1], [(1, -1)])
+        [1, 2]
+    """
+    F = set(tuple(v) for v in F)
+    parent = list(range(len(weights)))
+
+    def root(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i, j in combinations(range(len(weights)), 2):
+        d = tuple(b - a for a, b in zip(weights[i], weights[j]))
+        if d in F or tuple(-di for di in d) in F:
+            parent[root(j)] = root(i)
+
+    layer_dims = {}
+    for i, di in enumerate(dims):
+        r = root(i)
+        layer_dims[r] = layer_dims.get(r, 0) + di
+    return sorted(layer_dims.values())
 
-        # check if quotient is not torsion-free
-        if any(qi > 0 for qi in Q.invariants()):
-            continue
 
-        quot_layers = {}
-        for n in weights:
-            pi_n = tuple(Q(V(tuple(n))))
-            if pi_n not in quot_layers:
-                quot_layers[pi_n] = []
-            quot_layers[pi_n].extend(maxgrading.layers()[n])
-
-        # expand away denominators to get an integer vector grading
-        A = AdditiveAbelianGroup(Q.invariants())
-        denoms = [pi_n_k.denominator() for pi_n in quot_layers
-                                       for pi_n_k in pi_n]
-        mult = lcm(denoms)
-        proj_layers = {tuple(mult * pi_nk for pi_nk in pi_n):l
-                       for pi_n, l in quot_layers.items()}
-        proj_grading = grading(L, proj_layers, magma=A, projections=True)
-        projected_gradings.append(proj_grading)
-    return projected_gradings
+def count_torsion_free_gradings(L, by=None, processes=1, symmetry=False,
+                                **filters):
+    r"""
+    Return the number of gradings of the Lie algebra over torsion free
+    abelian groups.
+
+    The gradings are enumerated as in :func:`torsion_free_gradings`, but
+    only the projections of the weights are computed, so no layers or
+    gradings are constructed.
+
+    INPUT:
+
+    - ``L`` -- a Lie algebra
+    - ``by`` -- (default:``None``) one of ``None``, ``'rank'`` and
+      ``'label'``; if ``None``, the total number of gradings is
+      returned, and otherwise a dictionary of the numbers of gradings
+      indexed by the ranks of the grading groups or by the types of the
+      gradings, see :meth:`~lie_gradings.gradings.records.GradingRecord.label`
+    - ``processes`` -- (default:``1``) the number of worker processes
+      computing the quotients
+    - ``symmetry`` -- (default:``False``) a boolean; if ``True``, count
+      only one grading for each orbit of the weight automorphisms, i.e.,
+      count isomorphic gradings related by the weight automorphisms once,
+      see :func:`weight_automorphisms`
+    - ``filters`` -- the filters of :func:`iter_torsion_free_gradings`
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import count_torsion_free_gradings
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: count_torsion_free_gradings(L)
+        5
+        sage: count_torsion_free_gradings(L, by='rank')
+        {0: 1, 1: 3, 2: 1}
+        sage: count_torsion_free_gradings(L, by='label')
+        {'0.001': 1, '1.11': 3, '2.3': 1}
+        sage: count_torsion_free_gradings(L, by='layers')
+        Traceback (most recent call last):
+        ...
+        ValueError: cannot count gradings by 'layers'
+    """
+    if by is None:
+        key = None
+    elif by == 'rank':
+        key = GradingRecord.rank
+    elif by == 'label':
+        key = GradingRecord.label
+    else:
+        raise ValueError("cannot count gradings by %r" % (by,))
+
+    records = iter_torsion_free_gradings(L, processes=processes,
+                                         symmetry=symmetry, records=True,
+                                         **filters)
+    if key is None:
+        return sum(1 for record in records)
+
+    counts = {}
+    for record in records:
+        k = key(record)
+        counts[k] = counts.get(k, 0) + 1
+    return counts
+
+
+def grading_refinement_poset(L):
+    r"""
+    Return the poset of gradings of the Lie algebra over torsion free
+    abelian groups ordered by refinement.
+
+    The elements of the poset are the gradings of
+    :func:`torsion_free_gradings`, and a grading is smaller than another
+    if it is a refinement of the other one. The relations are read off
+    from the inclusions of the flats of weight differences defining the
+    gradings during the enumeration, so no pairwise comparisons of
+    gradings are needed.
+
+    INPUT:
+
+    - ``L`` -- a Lie algebra
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import (grading_refinement_poset,
+        ....:                                            torsion_free_gradings)
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: P = grading_refinement_poset(L); P
+        Finite poset containing 5 elements
+        sage: len(P.cover_relations())
+        6
+        sage: grs = torsion_free_gradings(L)
+        sage: P.bottom() is grs[0], P.top() is grs[-1]
+        (True, True)
+        sage: all(gr1.is_refinement(gr2) for gr1, gr2 in P.relations())
+        True
+    """
+    maxgrading = maximal_grading(L)
+    k = len(maxgrading.magma().gens())
+    weights = maxgrading.layers().keys()
+    weight_vectors = [tuple(n) for n in weights]
+
+    # the quotients by nested flats are nested coarsenings
+    diffset = set([tuple(b - a) for a, b in combinations(weights, 2)])
+    relations = []
+    gradings = []
+    for F in _arrangement_flats(diffset, k, relations=relations):
+        with _phase('quotient'):
+            invariants, proj = _quotient_projection(k, weight_vectors, F)
+        record = GradingRecord(maxgrading, len(invariants), proj)
+        gradings.append(record.grading())
+
+    covers = [(gradings[i], gradings[j]) for i, j in set(relations)]
+    return Poset((gradings, covers), cover_relations=True, facade=True)
+
+
+def _quotient_projection(k, weights, F):
+    r"""
+    Return the projections of the weights ``weights`` to the torsion
+    free quotient of `\mathbb{Z}^k` by the rational span of the vectors
+    ``F``.
+
+    The kernel of the projection is the saturated sublattice of integer
+    vectors in the rational span of ``F``, so the quotient is
+    torsion free by construction.
+
+    INPUT:
+
+    - ``k`` -- the rank of the lattice
+    - ``weights`` -- a list of integer vectors as tuples
+    - ``F`` -- a list of integer vectors as tuples
+
+    OUTPUT:
+
+    A pair ``(invariants, proj)``, where ``invariants`` are the
+    invariants of the quotient and ``proj`` is the list of projections
+    of the weights as integer tuples.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _quotient_projection
+        sage: invariants, proj = _quotient_projection(2, [(1, 0), (0, 1), (1, 1)],
+        ....:                                         [(1, -1)])
+        sage: invariants
+        (0,)
+        sage: proj[0] == proj[1], proj[2] == (2 * proj[0][0],)
+        (True, True)
+
+    The kernel of the projection is saturated::
+
+        sage: invariants, proj = _quotient_projection(2, [(1, 0), (0, 1)], [(2, 0)])
+        sage: invariants, proj[0]
+        ((0,), (0,))
+    """
+    V = FreeModule(ZZ, k)
+    Q = V.quotient(V.submodule(F).saturation())
+
+    # expand away denominators to get an integer vector grading
+    quot = [tuple(Q(V(n))) for n in weights]
+    mult = lcm([pi_n_k.denominator() for pi_n in quot for pi_n_k in pi_n])
+    proj = [tuple(mult * pi_n_k for pi_n_k in pi_n) for pi_n in quot]
+    return (tuple(Q.invariants()), proj)
+
+
+def _quotient_projections(k, weights, flats):
+    r"""
+    Return the list of :func:`_quotient_projection` for each of the
+    flats ``flats``.
+    """
+    return [_quotient_projection(k, weights, F) for F in flats]
+
+
+def _iter_quotient_projections(k, weights, flats):
+    r"""
+    Iterate over :func:`_quotient_projection` for each of the flats in
+    the iterator ``flats``.
+    """
+    while True:
+        with _phase('subspace_enumeration'):
+            F = next(flats, None)
+        if F is None:
+            return
+        with _phase('quotient'):
+            data = _quotient_projection(k, weights, F)
+        yield data
+
+
+def _iter_quotient_projections_parallel(k, weights, flats, processes,
+                                        chunksize=32):
+    r"""
+    Iterate over :func:`_quotient_projection` for each of the flats in
+    the iterator ``flats`` computed in a pool of ``processes`` worker
+    processes.
+
+    The flats are sent to the workers in chunks of ``chunksize`` flats
+    as they are enumerated, with at most two chunks per worker pending at
+    a time, and the results are yielded in the order of the flats. If
+    the iteration is stopped early, no further flats are enumerated.
+
+    The worker processes do not report to the profiling callbacks, so
+    the ``'quotient'`` phase is recorded once per chunk as the wall time
+    spent waiting for its results.
+    """
+    flats = iter(flats)
+    max_pending = 2 * (processes or os.cpu_count() or 1)
+    executor = ProcessPoolExecutor(max_workers=processes)
+    pending = deque()
+    exhausted = False
+    try:
+        while True:
+            # keep the workers busy with a bounded number of chunks
+            while not exhausted and len(pending) < max_pending:
+                with _phase('subspace_enumeration'):
+                    chunk = list(islice(flats, chunksize))
+                if not chunk:
+                    exhausted = True
+                    break
+                pending.append(executor.submit(_quotient_projections,
+                                               k, weights, chunk))
+            if not pending:
+                return
+            future = pending.popleft()
+            with _phase('quotient'):
+                chunk_data = future.result()
+            for data in chunk_data:
+                yield data
+    finally:
+        # cancel pending work if the iteration is stopped early
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _center_dimension(n, R, brackets):
+    r"""
+    Return the dimension of the center of a Lie algebra given by its
+    nonzero structure coefficients.
+
+    INPUT:
+
+    - ``n`` -- the dimension of the Lie algebra
+    - ``R`` -- the base ring
+    - ``brackets`` -- a dictionary ``{(i, j): {k: c_ij^k}}`` of the
+      nonzero structure coefficients
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import _center_dimension
+        sage: _center_dimension(3, QQ, {(0, 1): {2: 1}, (1, 0): {2: -1}})
+        1
+    """
+    # X = sum x_i Y_i is central iff sum_i x_i c_ij^k = 0 for all j, k
+    entries = {}
+    for (i, j), c_ij in brackets.items():
+        for k, c in c_ij.items():
+            entries[(j * n + k, i)] = c
+    A = matrix(R, n * n, n, entries, sparse=True)
+    return n - A.rank()
+
+
+def _has_stratifying_projection(maxgrading):
+    r"""
+    Return whether the weights of a maximal grading are compatible with a
+    stratification.
+
+    Every stratification is, up to an automorphism, a coarsening of the
+    maximal grading by a homomorphism `\varphi\colon\mathbb{Z}^k\to
+    \mathbb{Z}`. The weights `w` of layers not contained in the derived
+    algebra must then have `\varphi(w) = 1`, and all weights must have
+    positive integer values. If no such homomorphism exists, the Lie
+    algebra is not stratifiable. The converse does not hold in general.
+
+    The conclusion relies on the grading being maximal: a coarser
+    grading, e.g. one computed by :func:`maximal_grading` with a too
+    small ``rank``, may reject a stratifiable Lie algebra.
+
+    INPUT:
+
+    - ``maxgrading`` -- a maximal grading over `\mathbb{Z}^k`
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import (maximal_grading,
+        ....:                                            _has_stratifying_projection)
+        sage: L = LieAlgebra(QQ, 2, step=3)
+        sage: _has_stratifying_projection(maximal_grading(L))
+        True
+        sage: L = LieAlgebra(QQ, {('X_1','X_3'): {'X_4': 1},
+        ....:                     ('X_1','X_4'): {'X_5': 1},
+        ....:                     ('X_2','X_3'): {'X_5': 1}},
+        ....:                    names='X_1,X_2,X_3,X_4,X_5')
+        sage: _has_stratifying_projection(maximal_grading(L))
+        False
+    """
+    L = maxgrading.lie_algebra()
+    try:
+        m = L.module()
+    except AttributeError:
+        m = FreeModule(L.base_ring(), L.dimension())
+    basis = L.basis().list()
+    derived = m.submodule([L.bracket(X, Y).to_vector()
+                           for X, Y in combinations(basis, 2)])
+
+    layers = maxgrading.layers()
+    weights = [vector(QQ, tuple(a)) for a in layers]
+    generators = [w for w, a in zip(weights, layers)
+                  if any(X.to_vector() not in derived for X in layers[a])]
+    if not generators or any(not w for w in weights):
+        return False
+
+    # solve phi(w) = 1 for the generating weights
+    A = matrix(QQ, generators)
+    try:
+        phi = A.solve_right(vector(QQ, [1] * len(generators)))
+    except ValueError:
+        return False
+
+    # the values of phi on weights in the span of the generating weights
+    # are determined, and must be positive integers
+    span = A.row_space()
+    for w in weights:
+        if w in span:
+            value = w * phi
+            if value not in ZZ or value < 1:
+                return False
+    return True
 
 
 def stratification(L):
@@ -314,7 +1696,91 @@ def stratification(L):
         ...
         ValueError: Lie algebra on 5 generators (X_1, X_2, X_3, X_4,
         X_5) over Rational Field is not a stratifiable Lie algebra
+
+    The results, including the negative ones, are cached for the most
+    recently used Lie algebras, see :func:`clear_stratification_cache`::
+
+        sage: stratification(L)
+        Traceback (most recent call last):
+        ...
+        ValueError: Lie algebra on 5 generators (X_1, X_2, X_3, X_4,
+        X_5) over Rational Field is not a stratifiable Lie algebra
+        sage: stratification(strat.lie_algebra()) is strat
+        True
     """
+    try:
+        result = _stratification_cache.pop(L)
+    except KeyError:
+        try:
+            result = _stratification(L)
+        except ValueError as e:
+            result = e
+    except TypeError:
+        # unhashable Lie algebra, no caching
+        return _stratification(L)
+
+    # mark the Lie algebra as most recently used
+    _stratification_cache[L] = result
+    while len(_stratification_cache) > STRATIFICATION_CACHE_SIZE:
+        _stratification_cache.popitem(last=False)
+
+    if isinstance(result, ValueError):
+        raise ValueError(*result.args)
+    return result
+
+
+def clear_stratification_cache():
+    r"""
+    Clear the cache of results of :func:`stratification`.
+
+    At most :data:`STRATIFICATION_CACHE_SIZE` results for the most
+    recently used Lie algebras are kept in the cache.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.grading import (stratification,
+        ....:                                            clear_stratification_cache)
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: strat = stratification(L)
+        sage: clear_stratification_cache()
+        sage: stratification(L) is strat
+        True
+    """
+    _stratification_cache.clear()
+
+
+def _stratification(L):
+    r"""
+    Return a stratification of the Lie algebra if one exists, without
+    caching.
+
+    See :func:`stratification`.
+
+    Before the linear system is assembled, two necessary conditions are
+    checked. If the maximal grading is cached, it must admit a projection
+    to `\mathbb{Z}` compatible with a stratification, see
+    :func:`_has_stratifying_projection`. The cache only holds gradings
+    computed by a full search for a maximal torus, so a cached grading
+    is maximal and the check is conclusive.
+
+    The centers of the Lie algebra and of its associated graded Lie
+    algebra must also have the same dimension. This replaces checking
+    that the first quotient of the lower central series generates
+    quotients of the right dimensions under iterated brackets: for a
+    nilpotent Lie algebra the first quotient always generates the
+    associated graded Lie algebra, so that check never rejects anything,
+    whereas a stratifiable Lie algebra is isomorphic to its associated
+    graded Lie algebra, so the dimensions of the centers must agree.
+    """
+    # a stratification is a coarsening of a maximal grading, so a known
+    # maximal grading can reject the Lie algebra before any linear algebra
+    cache = maximal_grading_cache()
+    if cache is not None:
+        maxgrading = cache.get(L)
+        if (maxgrading is not None
+                and not _has_stratifying_projection(maxgrading)):
+            raise ValueError("%s is not a stratifiable Lie algebra" % L)
+
     lcs = L.lower_central_series(submodule=True)
     quots = [V.quotient(W) for V, W in zip(lcs, lcs[1:])]
 
@@ -337,53 +1803,111 @@ def stratification(L):
     sm = m.submodule_with_basis(adapted_basis)
 
     # form the linear system Ax=b of constraints from the Leibniz rule
-    paramspace = [(k, h) for k in range(L.dimension())
-                         for h in range(L.dimension())
+    # in the adapted basis, with only the nonzero entries stored
+    n = L.dimension()
+    R = L.base_ring()
+    paramspace = [(k, h) for k in range(n)
+                         for h in range(n)
                          if weights[h] > weights[k]]
+    param_index = {kh: c for c, kh in enumerate(paramspace)}
+    params_of = [[h for h in range(n) if weights[h] > weights[k]]
+                 for k in range(n)]
+
+    # structure coefficients in the adapted basis
+    brackets = {}
+    for i in range(n):
+        for j in range(i + 1, n):
+            Y_ij = L.bracket(adapted_basis[i], adapted_basis[j])
+            c_ij = sm.coordinate_vector(Y_ij.to_vector())
+            c_ij = {k: ck for k, ck in enumerate(c_ij) if ck}
+            brackets[(i, j)] = c_ij
+            brackets[(j, i)] = {k: -ck for k, ck in c_ij.items()}
+    for i in range(n):
+        brackets[(i, i)] = {}
+
+    # a stratifiable Lie algebra is isomorphic to its associated graded
+    # Lie algebra, so their centers have the same dimension; generation
+    # of the graded algebra by the first quotient is automatic for
+    # nilpotent Lie algebras, so this is the cheap check that can fail
+    graded_brackets = {(i, j): {k: c for k, c in c_ij.items()
+                                if weights[k] == weights[i] + weights[j]}
+                       for (i, j), c_ij in brackets.items()}
+    if _center_dimension(n, R, brackets) != _center_dimension(n, R, graded_brackets):
+        raise ValueError("%s is not a stratifiable Lie algebra" % L)
+
+    # the row (i, j, r) is the Y_r component of the Leibniz rule
+    # for the pair (Y_i, Y_j)
     Arows = []
     bvec = []
-    zerovec = m.zero()
-
-    for i in range(L.dimension()):
-        Y_i = adapted_basis[i]
+    for i in range(n):
         w_i = weights[i]
-        for j in range(i + 1, L.dimension()):
-            Y_j = adapted_basis[j]
+        for j in range(i + 1, n):
             w_j = weights[j]
-            Y_ij = L.bracket(Y_i, Y_j)
-            c_ij = sm.coordinate_vector(Y_ij.to_vector())
-
-            bcomp = L.zero()
-            for k in range(L.dimension()):
-                w_k = weights[k]
-                Y_k = adapted_basis[k]
-                bcomp += (w_k - w_i - w_j) * c_ij[k] * Y_k
-            bv = bcomp.to_vector()
-
-            Acomp = {}
-            for k, h in paramspace:
-                w_k = weights[k]
-                Y_h = adapted_basis[h]
-                if k == i:
-                    Acomp[(k, h)] = L.bracket(Y_h, Y_j).to_vector()
-                elif k == j:
-                    Acomp[(k, h)] = L.bracket(Y_i, Y_h).to_vector()
-                elif w_k >= w_i + w_j:
-                    Acomp[(k, h)] = -c_ij[k] * Y_h
-
-            for r in range(L.dimension()):
-                Arows.append([Acomp.get((k, h), zerovec)[r]
-                              for k, h in paramspace])
-                bvec.append(bv[r])
-
-    A = matrix(L.base_ring(), Arows)
-    b = vector(L.base_ring(), bvec)
-
-    # solve the linear system Ax=b if possible
-    try:
-        coeffs_flat = A.solve_right(b)
-    except ValueError:
-        raise ValueError("%s is not a stratifiable Lie algebra" % L)
+            c_ij = brackets[(i, j)]
+            rows = {}
+            for h in params_of[i]:
+                col = param_index[(i, h)]
+                for r, c in brackets[(h, j)].items():
+                    row = rows.setdefault(r, {})
+                    row[col] = row.get(col, 0) + c
+            for h in params_of[j]:
+                col = param_index[(j, h)]
+                for r, c in brackets[(i, h)].items():
+                    row = rows.setdefault(r, {})
+                    row[col] = row.get(col, 0) + c
+            for k, ck in c_ij.items():
+                if k == i or k == j or weights[k] < w_i + w_j:
+                    continue
+                for h in params_of[k]:
+                    row = rows.setdefault(h, {})
+                    col = param_index[(k, h)]
+                    row[col] = row.get(col, 0) - ck
+
+            for r in range(n):
+                row = {col: c for col, c in rows.get(r, {}).items() if c}
+                br = (weights[r] - w_i - w_j) * c_ij.get(r, 0)
+                if not row:
+                    if br:
+                        # an inconsistent equation 0 = br
+                        raise ValueError("%s is not a stratifiable Lie algebra" % L)
+                    continue
+                Arows.append(row)
+                bvec.append(br)
+
+    # split the system into independent blocks of equations
+    # sharing no unknowns
+    component = list(range(len(paramspace)))
+
+    def root(c):
+        while component[c] != c:
+            component[c] = component[component[c]]
+            c = component[c]
+        return c
+
+    for row in Arows:
+        cols = list(row)
+        for col in cols[1:]:
+            component[root(col)] = root(cols[0])
+    blocks = {}
+    for row, br in zip(Arows, bvec):
+        blocks.setdefault(root(next(iter(row))), []).append((row, br))
+
+    # solve the linear system Ax=b if possible, one block at a time
+    coeffs_flat = [R.zero()] * len(paramspace)
+    for block in blocks.values():
+        cols = sorted(set(col for row, br in block for col in row))
+        col_index = {col: c for c, col in enumerate(cols)}
+        entries = {(r, col_index[col]): c for r, (row, br) in enumerate(block)
+                   for col, c in row.items()}
+        A = matrix(R, len(block), len(cols), entries, sparse=True)
+        b = vector(R, [br for row, br in block])
+        try:
+            with _phase('linear_solve'):
+                x = A.solve_right(b)
+        except ValueError:
+            raise ValueError("%s is not a stratifiable Lie algebra" % L)
+        for col, xc in zip(cols, x):
+            coeffs_flat[col] = xc
 
     coeffs = {(k, h):ckh for (k, h), ckh
             in zip(paramspace, coeffs_flat)}
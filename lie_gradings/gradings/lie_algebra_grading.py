@@ -20,15 +20,77 @@ from sage.rings.polynomial.polynomial_ring_constructor import PolynomialRing
 from sage.rings.polynomial.term_order import TermOrder
 from sage.structure.element import get_coercion_model
 from sage.structure.parent import Parent
-from sage.structure.unique_representation import UniqueRepresentation
+from sage.structure.unique_representation import UniqueRepresentation, unreduce
 from sage.symbolic.ring import SR
 
-from lie_gradings.gradings.utilities import in_new_basis
+from lie_gradings.gradings.utilities import in_new_basis, submodule_key
 
 __all__ = ['grading']
 
 
-def grading(L, layers, magma=None, projections=False, check=True):
+def _element_sort_key(X):
+    r"""
+    Return the nonzero coordinates of the Lie algebra element ``X`` as a
+    tuple of pairs ``(index, coefficient)``, used to sort the elements of
+    a layer canonically.
+
+    Elements with leading terms earlier in the basis of the Lie algebra
+    come first, so basis elements are sorted in the order of the basis.
+
+    EXAMPLES::
+
+        sage: import sys, pathlib
+        sage: sys.path.append(str(pathlib.Path().absolute()))
+        sage: from lie_gradings.gradings.lie_algebra_grading import _element_sort_key
+        sage: L.<X,Y,Z> = LieAlgebra(QQ, {('X','Y'): {'Z': 1}})
+        sage: _element_sort_key(Y), _element_sort_key(2*X + Y)
+        (((1, 1),), ((0, 2), (1, 1)))
+        sage: sorted([Z, Y, X, Y + Z], key=_element_sort_key)
+        [X, Y, Y + Z, Z]
+    """
+    return tuple((i, c) for i, c in enumerate(X.to_vector()) if c)
+
+
+def _weight_sort_key(a):
+    r"""
+    Return the exact coordinates of the weight ``a`` as a tuple, used to
+    sort the weights of a grading canonically.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.lie_algebra_grading import _weight_sort_key
+        sage: A = AdditiveAbelianGroup([2, 0])
+        sage: _weight_sort_key(A((3, -1))), _weight_sort_key(QQbar(2).sqrt())
+        ((1, -1), (1.414213562373095?,))
+    """
+    try:
+        return tuple(a)
+    except TypeError:
+        return (a,)
+
+
+def _canonical_sort(items, key):
+    r"""
+    Return the list ``items`` sorted by ``key``, or by the string
+    representations of the items if the keys are not comparable.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.lie_algebra_grading import (_canonical_sort,
+        ....:                                                       _weight_sort_key)
+        sage: _canonical_sort([(0, 2), (0, 10), (-2, 1)], _weight_sort_key)
+        [(-2, 1), (0, 2), (0, 10)]
+        sage: _canonical_sort([1, 'a'], _weight_sort_key)
+        [1, 'a']
+    """
+    try:
+        return sorted(items, key=key)
+    except (AttributeError, TypeError):
+        return sorted(items, key=str)
+
+
+def grading(L, layers, magma=None, projections=False, check=True,
+            trusted=False):
     r"""
     Return a grading of the Lie algebra over an additive magma.
 
@@ -54,6 +116,12 @@ def grading(L, layers, magma=None, projections=False, check=True):
     - ``check`` -- (default:``True``) a boolean; if ``True``, verify
       that the layers span the full Lie algebra, are disjoint, and
       respect the bracket
+    - ``trusted`` -- (default:``False``) a boolean; if ``True``, the
+      keys of ``layers`` are assumed to be distinct elements of
+      ``magma``, and the values nonempty lists of elements of ``L``, so
+      the conversion and merging of the layers is skipped. Intended for
+      internal callers constructing gradings from known gradings. Both
+      ``L`` and ``magma`` must be given.
 
     EXAMPLES:
 
@@ -74,9 +142,29 @@ def grading(L, layers, magma=None, projections=False, check=True):
           (0, 1) : (W, Y)
           (1, 0) : (X,)
           (1, 1) : (Z,)
+
+    The elements of each layer are listed in the order of the basis of
+    the Lie algebra::
+
+        sage: H = lie_algebras.Heisenberg(QQ, 1)
+        sage: p1, q1, z = H.basis()
+        sage: grH = grading(H, {1: [q1, p1], 2: [z]})
+        sage: grH[1]
+        (p1, q1)
+
+    Trusted input gives the same grading::
+
+        sage: layers = {A((1,0)): [X], A((0,1)): [Y,W], A((1,1)): [Z]}
+        sage: grading(L, layers, magma=A, trusted=True) is gr
+        True
+        sage: grading(L, layers, trusted=True)
+        Traceback (most recent call last):
+        ...
+        ValueError: a trusted grading requires the Lie algebra and the magma
     """
     return LieAlgebraGrading(layers, lie_algebra=L, magma=magma,
-                             projections=projections, check=check)
+                             projections=projections, check=check,
+                             trusted=trusted)
 
 
 class LieAlgebraGrading(Parent, UniqueRepresentation):
@@ -196,7 +284,8 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
 
     @staticmethod
     def __classcall_private__(cls, layers, lie_algebra=None, magma=None,
-                             projections=False, check=True, sc=None, **kwds):
+                             projections=False, check=True, sc=None,
+                             trusted=False, **kwds):
         """
         Normalize input to ensure a unique representation.
 
@@ -208,10 +297,72 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
             sage: gr2 = grading(L, {0: [X, Y]}, magma=GF(2))
             sage: gr1 is gr2
             True
+
+        Checked and unchecked constructions give the same grading::
+
+            sage: gr3 = grading(L, {0: [X, Y]}, magma=GF(2), check=False)
+            sage: gr3 is gr1
+            True
         """
         if not layers:
             raise ValueError("a grading must have layers")
 
+        if trusted:
+            # the layers are known to be in canonical form
+            if lie_algebra is None or magma is None:
+                raise ValueError("a trusted grading requires the Lie "
+                                 "algebra and the magma")
+            newlayers = dict(layers)
+        else:
+            newlayers, lie_algebra, magma = cls._normalize_layers(
+                layers, lie_algebra, magma)
+
+        # sort the weights and the elements of the layers by their exact
+        # coordinates, string representations are only used for display
+        layertuple = tuple(
+            (a, tuple(_canonical_sort(newlayers[a], _element_sort_key)))
+            for a in _canonical_sort(newlayers, _weight_sort_key))
+
+        # Lie algebras are hashed based on their string representation,
+        # so if the only way two gradings differ is in the internal structure
+        # of the Lie algebras, UniqueRepresentation may fail.
+        # Include the structure coefficients when possible to mitigate this.
+        try:
+            sc = lie_algebra.structure_coefficients()
+        except AttributeError:
+            sc = None
+
+        # check and trusted only affect the validation of the input, so
+        # they are not part of the key of the unique representation
+        gr = super(LieAlgebraGrading, cls).__classcall__(cls, layertuple,
+                            lie_algebra, magma, projections, sc=sc, **kwds)
+        if check and not gr._checked:
+            # verify validity of grading
+            gr._test_direct_sum()
+            gr._test_grading()
+            gr._checked = True
+        return gr
+
+    @staticmethod
+    def _normalize_layers(layers, lie_algebra, magma):
+        r"""
+        Return a triple ``(layers, lie_algebra, magma)`` with the layers
+        as a dictionary with keys in the magma and values nonempty lists
+        of elements of the Lie algebra, inferring the Lie algebra and the
+        magma if not given.
+
+        Layers with keys identical after conversion to the magma are
+        merged, and empty layers are removed.
+
+        EXAMPLES::
+
+            sage: from lie_gradings.gradings.lie_algebra_grading import LieAlgebraGrading
+            sage: L.<X,Y> = LieAlgebra(QQ, {('X','Y'): {'Y': 1}})
+            sage: LieAlgebraGrading._normalize_layers({0: [X], 2: [Y], 1: []},
+            ....:                                     None, GF(2))
+            ({0: [X, Y]}, Lie algebra on 2 generators (X, Y) over Rational Field,
+             Finite Field of size 2)
+        """
         layers = dict(layers)
         if not magma:
             # infer indexing magma from layer indices
@@ -239,25 +390,10 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
             if ma not in newlayers:
                 newlayers[ma] = []
             newlayers[ma].extend((lie_algebra(X) for X in layers[a]))
-
-        strkey = lambda s: str(s)
-        layertuple = tuple((a, tuple(sorted(newlayers[a], key=strkey)))
-                           for a in sorted(newlayers, key=strkey))
-
-        # Lie algebras are hashed based on their string representation,
-        # so if the only way two gradings differ is in the internal structure
-        # of the Lie algebras, UniqueRepresentation may fail.
-        # Include the structure coefficients when possible to mitigate this.
-        try:
-            sc = lie_algebra.structure_coefficients()
-        except AttributeError:
-            sc = None
-
-        return super(LieAlgebraGrading, cls).__classcall__(cls, layertuple,
-                            lie_algebra, magma, projections, check, sc, **kwds)
+        return newlayers, lie_algebra, magma
 
     def __init__(self, layers, lie_algebra, magma,
-                 projections, check, sc, **kwds):
+                 projections, sc, **kwds):
         r"""
         Initialize ``self``.
 
@@ -273,25 +409,62 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
         self._A = magma
         self._layers = dict(layers)
         self._projections = projections
-
-        if check:
-            # verify validity of grading
-            self._test_direct_sum()
-            self._test_grading()
-
-        # if it is well defined, initialize the poset of weights
-        # where a<c if a!=0 and there exists b!=0 such that a+b=c
-        els = tuple(self._layers.keys())
-        rels = [(a, c) for a in els for b in els
-                for c in els if a + b == c and a and b]
-        try:
-            self._weight_poset = Poset([els, rels])
-        except ValueError:
-            self._weight_poset = None
+        # whether the grading has been validated, see __classcall_private__
+        self._checked = False
 
         C = Sets()
         Parent.__init__(self, base=self._L.base_ring(), category=C)
 
+    def __reduce__(self):
+        r"""
+        Return the data to pickle ``self``.
+
+        The stored layers are in canonical form, so the grading is
+        reconstructed with the trusted constructor without checks.
+
+        EXAMPLES::
+
+            sage: from lie_gradings.gradings.lie_algebra_grading import grading
+            sage: L.<X,Y> = LieAlgebra(QQ, {('X','Y'): {'Y': 1}})
+            sage: gr = grading(L, {0: [X], 1: [Y]})
+            sage: loads(dumps(gr)) is gr
+            True
+        """
+        cls, args, kwds = self._reduction
+        kwds = dict(kwds, check=False, trusted=True)
+        return (unreduce, (cls, args, kwds))
+
+    @cached_method
+    def _weight_poset(self):
+        r"""
+        Return the poset of weights where `a<c` if `a\neq 0` and there
+        exists `b\neq 0` such that `a+b=c`, or ``None`` if the relation
+        does not define a partial order.
+
+        EXAMPLES::
+
+            sage: from lie_gradings.gradings.lie_algebra_grading import grading
+            sage: L.<X,Y,Z> = LieAlgebra(QQ, {('X','Y'): {'Z': 1}})
+            sage: gr = grading(L, {2: [X], 4: [Y], 6: [Z]})
+            sage: gr._weight_poset().cover_relations()
+            [[2, 4], [4, 6]]
+            sage: sc = {('X','Y'): {'Z': 1}, ('X','Z'): {'W': 1}}
+            sage: L.<X,Y,Z,W> = LieAlgebra(QQ, sc)
+            sage: layers = {(1,0): [X], (0,1): [Y,W], (1,1): [Z]}
+            sage: gr = grading(L, layers, magma=AdditiveAbelianGroup([2, 0]))
+            sage: gr._weight_poset() is None
+            True
+        """
+        els = tuple(_canonical_sort(self._layers, _weight_sort_key))
+        # look up each sum among the weights instead of comparing it
+        # against every weight
+        rels = [(a, a + b) for a in els if a for b in els
+                if b and a + b in self._layers]
+        try:
+            return Poset([els, rels])
+        except ValueError:
+            return None
+
     def __iter__(self):
         r"""
         Iterate over the layers of the grading.
@@ -321,12 +494,13 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
                 sage: len([a for a in gr]) == 6
                 True
         """
-        if self._weight_poset is None:
+        P = self._weight_poset()
+        if P is None:
             for a in sorted(self._layers.keys()):
                 yield a
             return
 
-        for a in self._weight_poset:
+        for a in P:
             yield a
 
     def __contains__(self, a):
@@ -402,7 +576,7 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
         """
         str = "Grading over %s of %s with nonzero layers\n" % (self._A, self._L)
         for a in self:
-            la = self._layers[a]
+            la = tuple(sorted(self._layers[a], key=repr))
             str += "  %s : %s\n" % (a, la)
         return str
 
@@ -418,7 +592,8 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
             \langle X \rangle \oplus \langle Y, Z \rangle
         """
         layer_strs = []
-        for a, la in self._layers.items():
+        for a in sorted(self._layers, key=str):
+            la = sorted(self._layers[a], key=str)
             layer_str = ", ".join(latex(X) for X in la)
             layer_strs.append("\\langle %s \\rangle" % layer_str)
         return " \\oplus ".join(layer_strs)
@@ -488,10 +663,10 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
         """
         if self._L != other._L:
             raise ValueError("the gradings must have the same Lie algebra")
-        layer_modules = [self.layer_module(a) for a in self]
+        layer_keys = set(submodule_key(self.layer_module(a)) for a in self)
         for a in other:
             m = other.layer_module(a)
-            if m not in layer_modules:
+            if submodule_key(m) not in layer_keys:
                 return False
 
         return True
@@ -614,10 +789,11 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
             sage: gr.generating_weights()
             [(0, 1), (1, 0), (1, 1)]
         """
-        if self._weight_poset is None:
+        P = self._weight_poset()
+        if P is None:
             return [a for a in self]
         else:
-            return sorted(self._weight_poset.minimal_elements())
+            return sorted(P.minimal_elements())
 
     def is_refinement(self, grading):
         r"""
@@ -681,7 +857,11 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
                   for l in self._layers.values()]
         otherspaces = [m.submodule(X.to_vector() for X in l)
                        for l in grading._layers.values()]
+        otherkeys = set(submodule_key(sm2) for sm2 in otherspaces)
         for sm in spaces:
+            # equal layers are found by their keys without comparisons
+            if submodule_key(sm) in otherkeys:
+                continue
             if not any(sm.is_submodule(sm2) for sm2 in otherspaces):
                 return False
         return True
@@ -976,15 +1156,15 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
         """
         ugr = self.universal_realization()
         tfcomps = [i for i, inv in enumerate(ugr._A.invariants()) if inv == 0]
+        A = AdditiveAbelianGroup([0] * len(tfcomps))
         newlayers = {}
         for a in ugr:
             ta = tuple(a)
-            b = tuple(ta[i] for i in tfcomps)
+            b = A(tuple(ta[i] for i in tfcomps))
             if b not in newlayers:
                 newlayers[b] = []
             newlayers[b].extend(ugr[a])
-        A = AdditiveAbelianGroup([0] * len(tfcomps))
-        return grading(self._L, newlayers, magma=A)
+        return grading(self._L, newlayers, magma=A, trusted=True)
 
     @cached_method
     def universal_realization(self):
@@ -1087,16 +1267,18 @@ class LieAlgebraGrading(Parent, UniqueRepresentation):
 
         layer_labels = [tuple(Q(x)) for x in V.basis()]
 
+        k = len(Q.gens())
+        invs = Q.invariants()
+        A = AdditiveAbelianGroup(invs)
         newgrading = {}
         for a, label in zip(weights, layer_labels):
-            if label not in newgrading:
-                newgrading[label] = []
-            newgrading[label].extend(self[a])
+            b = A(label)
+            if b not in newgrading:
+                newgrading[b] = []
+            newgrading[b].extend(self[a])
 
-        k = len(Q.gens())
-        invs = Q.invariants()
-        return grading(self._L, newgrading, magma=AdditiveAbelianGroup(invs),
-                       projections=True)
+        return grading(self._L, newgrading, magma=A, projections=True,
+                       trusted=True)
 
     def isomorphism_equations(self, other, weight_map, reduced=False):
         r"""
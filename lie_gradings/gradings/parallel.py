@@ -0,0 +1,171 @@
+import pickle
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time
+
+from lie_gradings.gradings.grading import maximal_grading
+
+__all__ = ['GradingTask', 'maximal_gradings']
+
+
+class GradingTask(object):
+    r"""
+    The outcome of a grading computation for a single Lie algebra.
+
+    Contains the following data:
+
+    - ``index`` -- the position of the Lie algebra in the input
+    - ``lie_algebra`` -- the Lie algebra
+    - ``result`` -- the computed result, or ``None`` if the computation
+      raised an exception
+    - ``exception`` -- the raised exception, or ``None``
+    - ``traceback`` -- the formatted traceback of the raised exception,
+      or ``None``
+    - ``time`` -- the wall time of the computation in seconds, or
+      ``None`` if the worker process failed before reporting it
+
+    EXAMPLES::
+
+        sage: import sys, pathlib
+        sage: sys.path.append(str(pathlib.Path().absolute()))
+        sage: from lie_gradings.gradings.parallel import maximal_gradings
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: task = next(maximal_gradings([L], processes=1))
+        sage: task
+        Task 0 for Heisenberg algebra of rank 1 over Rational Field
+        completed in ... seconds
+        sage: task.result.magma()
+        Additive abelian group isomorphic to Z + Z
+    """
+
+    def __init__(self, index, lie_algebra, result=None, exception=None,
+                 traceback=None, time=None):
+        self.index = index
+        self.lie_algebra = lie_algebra
+        self.result = result
+        self.exception = exception
+        self.traceback = traceback
+        self.time = time
+
+    def __repr__(self):
+        if self.exception is not None and self.time is None:
+            return "Task %d for %s failed with %r" % (
+                self.index, self.lie_algebra, self.exception)
+        if self.exception is not None:
+            return "Task %d for %s failed in %.1f seconds with %r" % (
+                self.index, self.lie_algebra, self.time, self.exception)
+        return "Task %d for %s completed in %.1f seconds" % (
+            self.index, self.lie_algebra, self.time)
+
+    def succeeded(self):
+        r"""
+        Return whether the computation finished without an exception.
+        """
+        return self.exception is None
+
+
+def _run_task(func, index, L, kwds):
+    r"""
+    Run ``func(L, **kwds)`` and return a tuple
+    ``(index, result, exception, traceback, time)``.
+
+    Exceptions are caught and returned instead of raised, so that they
+    can be reported for the single task. Exceptions that cannot be
+    pickled are replaced by a :class:`RuntimeError` with the same message.
+    """
+    stime = time()
+    try:
+        result = func(L, **kwds)
+    except Exception as e:
+        tb = traceback.format_exc()
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError(repr(e))
+        return (index, None, e, tb, time() - stime)
+    return (index, result, None, None, time() - stime)
+
+
+def _map_tasks(func, lie_algebras, processes, kwds):
+    r"""
+    Iterate over :class:`GradingTask` objects of ``func`` applied to each
+    of ``lie_algebras`` in the order of completion.
+
+    Failures of the worker processes themselves, such as a terminated
+    worker breaking the pool or a result that cannot be pickled, are
+    reported in the tasks affected by them, so the other results are
+    still yielded::
+
+        sage: import os
+        sage: from lie_gradings.gradings.parallel import _map_tasks
+        sage: tasks = list(_map_tasks(os._exit, [1], 2, {}))
+        sage: tasks[0]
+        Task 0 for 1 failed with BrokenProcessPool(...)
+    """
+    lie_algebras = list(lie_algebras)
+    if processes == 1:
+        for index, L in enumerate(lie_algebras):
+            out = _run_task(func, index, L, kwds)
+            yield GradingTask(index, L, *out[1:])
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(_run_task, func, index, L, kwds): index
+                   for index, L in enumerate(lie_algebras)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                out = future.result()
+            except Exception as e:
+                # the worker died, e.g. a crash in a library or running out
+                # of memory, or the result could not be transferred
+                tb = traceback.format_exc()
+                yield GradingTask(index, lie_algebras[index], exception=e,
+                                  traceback=tb)
+                continue
+            yield GradingTask(index, lie_algebras[index], *out[1:])
+
+
+def maximal_gradings(lie_algebras, processes=None, **kwds):
+    r"""
+    Iterate over maximal gradings of several Lie algebras computed in a
+    pool of worker processes.
+
+    The computations are independent, and the results are yielded in the
+    order in which they complete.
+
+    INPUT:
+
+    - ``lie_algebras`` -- an iterable of Lie algebras
+    - ``processes`` -- (default:``None``) the number of worker processes;
+      if ``None``, the number of processors of the machine is used, and
+      if ``1``, the computations are done in the current process
+    - ``kwds`` -- keyword arguments passed on to
+      :func:`~lie_gradings.gradings.grading.maximal_grading`
+
+    OUTPUT:
+
+    An iterator of :class:`GradingTask` objects, each containing the
+    maximal grading or the exception raised for a single Lie algebra,
+    and the time taken by the computation.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.parallel import maximal_gradings
+        sage: algebras = [LieAlgebra(QQ, 2, step=k) for k in range(2, 5)]
+        sage: tasks = sorted(maximal_gradings(algebras, processes=2),
+        ....:                key=lambda task: task.index)
+        sage: [len(task.result.magma().gens()) for task in tasks]
+        [2, 2, 2]
+        sage: all(task.lie_algebra is L for task, L in zip(tasks, algebras))
+        True
+
+    Failed computations are reported in the task::
+
+        sage: tasks = list(maximal_gradings([None], processes=1))
+        sage: tasks[0].succeeded()
+        False
+        sage: tasks[0].exception
+        AttributeError(...)
+    """
+    return _map_tasks(maximal_grading, lie_algebras, processes, kwds)
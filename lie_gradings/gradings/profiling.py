@@ -0,0 +1,170 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+__all__ = ['PHASES', 'PhaseProfile', 'profile_phases',
+           'add_phase_callback', 'remove_phase_callback']
+
+PHASES = ('derivations_basis', 'centralizer', 'jordan_decomposition',
+          'eigenspaces', 'universal_realization', 'subspace_enumeration',
+          'quotient', 'linear_solve')
+
+_callbacks = []
+
+
+def add_phase_callback(callback):
+    r"""
+    Register a function to be called after each instrumented phase of
+    the grading computations.
+
+    The phases are listed in :data:`PHASES`. Phases computed in worker
+    processes are reported by the calling process: in a parallel
+    enumeration of torsion free gradings, the ``'quotient'`` phase is the
+    time spent waiting for each chunk of quotients.
+
+    INPUT:
+
+    - ``callback`` -- a function called as ``callback(phase, seconds)``
+      with the name of the phase and its wall time in seconds
+
+    EXAMPLES::
+
+        sage: import sys, pathlib
+        sage: sys.path.append(str(pathlib.Path().absolute()))
+        sage: from lie_gradings.gradings.profiling import (add_phase_callback,
+        ....:                                              remove_phase_callback)
+        sage: from lie_gradings.gradings.grading import maximal_grading
+        sage: phases = []
+        sage: def record(phase, seconds):
+        ....:     phases.append(phase)
+        sage: add_phase_callback(record)
+        sage: gr = maximal_grading(lie_algebras.Heisenberg(QQ, 1))
+        sage: remove_phase_callback(record)
+        sage: phases[0]
+        'derivations_basis'
+        sage: 'universal_realization' in phases
+        True
+    """
+    _callbacks.append(callback)
+
+
+def remove_phase_callback(callback):
+    r"""
+    Unregister a function registered with :func:`add_phase_callback`.
+
+    INPUT:
+
+    - ``callback`` -- a registered function
+    """
+    _callbacks.remove(callback)
+
+
+@contextmanager
+def _phase(name):
+    r"""
+    Context manager timing the phase ``name`` of a computation and
+    reporting it to the registered callbacks.
+
+    Without registered callbacks, no timing is done.
+    """
+    if not _callbacks:
+        yield
+        return
+    stime = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - stime
+        for callback in list(_callbacks):
+            callback(name, elapsed)
+
+
+class PhaseProfile(object):
+    r"""
+    Accumulated wall times and call counts of the phases of grading
+    computations.
+
+    A profile is usually created with :func:`profile_phases`, but it may
+    also be registered directly as a callback with
+    :func:`add_phase_callback`.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.profiling import PhaseProfile
+        sage: P = PhaseProfile()
+        sage: P('centralizer', 0.5)
+        sage: P('centralizer', 0.25)
+        sage: P.counts()
+        {'centralizer': 2}
+        sage: P.times()
+        {'centralizer': 0.75}
+        sage: P
+        phase                        calls     seconds
+        centralizer                      2       0.750
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._times = {}
+
+    def __call__(self, phase, seconds):
+        self._counts[phase] = self._counts.get(phase, 0) + 1
+        self._times[phase] = self._times.get(phase, 0.0) + seconds
+
+    def __repr__(self):
+        lines = ["%-24s %9s %11s" % ("phase", "calls", "seconds")]
+        for phase in self._phases():
+            lines.append("%-24s %9d %11.3f" % (phase, self._counts[phase],
+                                               self._times[phase]))
+        return "\n".join(lines)
+
+    def _phases(self):
+        r"""
+        Return the recorded phases in the order of :data:`PHASES`,
+        followed by any other phases in the order of recording.
+        """
+        known = [phase for phase in PHASES if phase in self._counts]
+        return known + [phase for phase in self._counts if phase not in PHASES]
+
+    def counts(self):
+        r"""
+        Return a dictionary of the number of calls of each phase.
+        """
+        return dict(self._counts)
+
+    def times(self):
+        r"""
+        Return a dictionary of the total wall time of each phase in
+        seconds.
+        """
+        return dict(self._times)
+
+
+@contextmanager
+def profile_phases():
+    r"""
+    Context manager profiling the phases of the grading computations
+    done within it.
+
+    OUTPUT:
+
+    A :class:`PhaseProfile` accumulating the times of the phases.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.profiling import profile_phases
+        sage: from lie_gradings.gradings.grading import torsion_free_gradings
+        sage: with profile_phases() as P:
+        ....:     grs = torsion_free_gradings(lie_algebras.Heisenberg(QQ, 1))
+        sage: P.counts()['quotient']
+        5
+        sage: P
+        phase                        calls     seconds
+        derivations_basis                1         ...
+        centralizer                      ...
+    """
+    profile = PhaseProfile()
+    add_phase_callback(profile)
+    try:
+        yield profile
+    finally:
+        remove_phase_callback(profile)
@@ -0,0 +1,176 @@
+from array import array
+
+from sage.groups.additive_abelian.additive_abelian_group import AdditiveAbelianGroup
+
+from lie_gradings.gradings.lie_algebra_grading import grading
+
+__all__ = ['GradingRecord']
+
+
+class GradingRecord(object):
+    r"""
+    A compact description of a grading of a Lie algebra as a projection
+    of its maximal grading.
+
+    A record stores only a reference to the maximal grading and the
+    images of its weights in `\mathbb{Z}^r` as a flat integer array.
+    The corresponding :class:`LieAlgebraGrading` is constructed only
+    when requested with :meth:`grading`.
+
+    INPUT:
+
+    - ``maxgrading`` -- a maximal grading over `\mathbb{Z}^k`
+    - ``rank`` -- the rank `r` of the projected grading group
+    - ``projection`` -- a list of integer tuples of length `r`, the
+      images of the weights of ``maxgrading`` in the order of
+      ``maxgrading.layers()``
+
+    EXAMPLES::
+
+        sage: import sys, pathlib
+        sage: sys.path.append(str(pathlib.Path().absolute()))
+        sage: from lie_gradings.gradings.grading import maximal_grading
+        sage: from lie_gradings.gradings.records import GradingRecord
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: mgr = maximal_grading(L); mgr
+        Grading over Additive abelian group isomorphic to Z + Z of
+        Heisenberg algebra of rank 1 over Rational Field with nonzero layers
+          (1, 0) : (p1,)
+          (0, 1) : (q1,)
+          (1, 1) : (z,)
+        sage: rec = GradingRecord(mgr, 1, [(1,), (1,), (2,)]); rec
+        Record of a grading over Z^1 of Heisenberg algebra of rank 1 over
+        Rational Field
+        sage: rec.layer_dimensions()
+        [1, 2]
+        sage: rec.grading()
+        Grading over Additive abelian group isomorphic to Z of Heisenberg
+        algebra of rank 1 over Rational Field with nonzero layers
+          (1) : (p1, q1)
+          (2) : (z,)
+    """
+    __slots__ = ('_maxgrading', '_rank', '_projection', '_grading')
+
+    def __init__(self, maxgrading, rank, projection):
+        self._maxgrading = maxgrading
+        self._rank = rank
+        self._projection = array('q', [int(x) for pi_n in projection
+                                       for x in pi_n])
+        self._grading = None
+
+    def __repr__(self):
+        return "Record of a grading over Z^%d of %s" % (
+            self._rank, self._maxgrading.lie_algebra())
+
+    def __getstate__(self):
+        return (self._maxgrading, self._rank, self._projection)
+
+    def __setstate__(self, state):
+        self._maxgrading, self._rank, self._projection = state
+        self._grading = None
+
+    def maximal_grading(self):
+        r"""
+        Return the maximal grading the record is a projection of.
+        """
+        return self._maxgrading
+
+    def lie_algebra(self):
+        r"""
+        Return the graded Lie algebra.
+        """
+        return self._maxgrading.lie_algebra()
+
+    def rank(self):
+        r"""
+        Return the rank of the grading group.
+        """
+        return self._rank
+
+    def projection(self):
+        r"""
+        Return a dictionary mapping the weights of the maximal grading to
+        their images as integer tuples.
+
+        EXAMPLES::
+
+            sage: from lie_gradings.gradings.grading import maximal_grading
+            sage: from lie_gradings.gradings.records import GradingRecord
+            sage: mgr = maximal_grading(lie_algebras.Heisenberg(QQ, 1))
+            sage: rec = GradingRecord(mgr, 1, [(1,), (0,), (1,)])
+            sage: sorted(rec.projection().values())
+            [(0,), (1,), (1,)]
+        """
+        r = self._rank
+        proj = self._projection
+        return {n: tuple(proj[i * r:(i + 1) * r])
+                for i, n in enumerate(self._maxgrading.layers())}
+
+    def projected_layers(self):
+        r"""
+        Return a dictionary mapping the images of the weights to the lists
+        of weights of the maximal grading projecting onto them.
+        """
+        layers = {}
+        for n, pi_n in self.projection().items():
+            if pi_n not in layers:
+                layers[pi_n] = []
+            layers[pi_n].append(n)
+        return layers
+
+    def layer_dimensions(self):
+        r"""
+        Return the sorted list of dimensions of the nonzero layers.
+        """
+        mlayers = self._maxgrading.layers()
+        return sorted(sum(len(mlayers[n]) for n in ns)
+                      for ns in self.projected_layers().values())
+
+    def label(self):
+        r"""
+        Return the type of the grading as a string ``k.n_1n_2...``, where
+        ``k`` is the rank of the grading group and ``n_i`` is the number
+        of ``i``-dimensional layers.
+
+        EXAMPLES::
+
+            sage: from lie_gradings.gradings.grading import maximal_grading
+            sage: from lie_gradings.gradings.records import GradingRecord
+            sage: mgr = maximal_grading(lie_algebras.Heisenberg(QQ, 1))
+            sage: GradingRecord(mgr, 1, [(1,), (1,), (2,)]).label()
+            '1.11'
+            sage: GradingRecord(mgr, 0, [(), (), ()]).label()
+            '0.001'
+        """
+        dims = self.layer_dimensions()
+        label = "%d." % self._rank
+        for k in range(1, max(dims) + 1):
+            label += str(dims.count(k))
+        return label
+
+    def grading(self, check=False):
+        r"""
+        Return the grading described by the record.
+
+        INPUT:
+
+        - ``check`` -- (default:``False``) a boolean; if ``True``, verify
+          that the layers define a grading. A projection of a grading is
+          always a grading, so the check is skipped by default.
+
+        The grading constructed without the check is cached.
+        """
+        if self._grading is not None and not check:
+            return self._grading
+
+        mlayers = self._maxgrading.layers()
+        A = AdditiveAbelianGroup([0] * self._rank)
+        layers = {}
+        for pi_n, ns in self.projected_layers().items():
+            layers[A(pi_n)] = sum((list(mlayers[n]) for n in ns), [])
+        # the weights are distinct and the layers are taken from a grading
+        gr = grading(self.lie_algebra(), layers, magma=A, projections=True,
+                     check=check, trusted=True)
+        if not check:
+            self._grading = gr
+        return gr
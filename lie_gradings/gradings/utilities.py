@@ -6,7 +6,8 @@ from sage.combinat.integer_vector import IntegerVectors
 from sage.matrix.constructor import matrix
 from sage.modules.free_module import FreeModule
 
-__all__ = ['in_new_basis', 'jordan_decomposition']
+__all__ = ['in_new_basis', 'jordan_decomposition', 'jordan_decompositions',
+           'derivations_basis', 'submodule_key']
 
 
 def in_new_basis(L, basis, names, check=True, category=None):
@@ -98,6 +99,39 @@ def in_new_basis(L, basis, names, check=True, category=None):
     return LieAlgebra(L.base_ring(), sc, names=names, category=C)
 
 
+def submodule_key(W):
+    r"""
+    Return a hashable key identifying the submodule ``W``.
+
+    The key is formed from the echelonized basis of ``W``, i.e., its
+    Hermite normal form over the integers and its reduced row echelon
+    form over a field. Two submodules of the same ambient module are
+    equal if and only if their keys are equal, so sets and dictionaries
+    of keys can be used to find equal submodules without pairwise
+    comparisons.
+
+    INPUT:
+
+    - ``W`` -- a submodule of a free module
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.utilities import submodule_key
+        sage: V = ZZ^2
+        sage: submodule_key(V.submodule([(2, 4), (0, 3)]))
+        (2, ((2, 1), (0, 3)))
+        sage: W1 = V.submodule([(1, 1)])
+        sage: W2 = V.submodule_with_basis([(-1, -1)])
+        sage: submodule_key(W1) == submodule_key(W2)
+        True
+        sage: V = QQ^2
+        sage: submodule_key(V.submodule([(2, 4)])) == submodule_key(V.submodule([(1, 2)]))
+        True
+    """
+    B = W.echelonized_basis_matrix()
+    return (W.degree(), tuple(tuple(r) for r in B.rows()))
+
+
 def jordan_decomposition(A):
     r"""
     Return the Jordan decomposition of the matrix ``A``.
@@ -198,15 +232,249 @@ def jordan_decomposition(A):
         4. If `h(A_k)=0`, then `A_k` is the semisimple part of the Jordan
            decomposition, so the Jordan decomposition is `A = A_k + (A-A_k)`.
         5. Otherwise, replace `A_k` by `A_k - h(A_k)q(A_k)` and repeat from 4.
+
+        Before the general algorithm, the following special cases are
+        detected and handled directly:
+
+        - diagonal matrices are semisimple,
+        - triangular matrices with a constant diagonal `d` have the
+          semisimple part `dI`,
+        - triangular matrices with distinct diagonal entries are
+          semisimple,
+        - block diagonal matrices, up to a permutation of the basis, are
+          decomposed one block at a time.
+
+    TESTS:
+
+    The blocks of a block diagonal matrix are decomposed independently::
+
+        sage: A = matrix(QQ, [[2, 0, 1, 0], [0, 0, 0, 1], [0, 0, 2, 0], [0, 0, 0, 0]])
+        sage: As, An = jordan_decomposition(A)
+        sage: As
+        [2 0 0 0]
+        [0 0 0 0]
+        [0 0 2 0]
+        [0 0 0 0]
+        sage: An
+        [0 0 1 0]
+        [0 0 0 1]
+        [0 0 0 0]
+        [0 0 0 0]
+        sage: A = matrix(QQ, [[1, 0, 0], [5, 2, 0], [0, 3, 3]])
+        sage: jordan_decomposition(A)[0] == A
+        True
+    """
+    return _jordan_decomposition(A, {})
+
+
+def jordan_decompositions(matrices):
+    r"""
+    Return the Jordan decompositions of a list of matrices.
+
+    The polynomials used by the algorithm of :func:`jordan_decomposition`
+    depend only on the minimal polynomial of the matrix. They are computed
+    once for each distinct minimal polynomial in the list and reused for
+    all matrices with an identical minimal polynomial. No other work is
+    shared, so for matrices with pairwise distinct minimal polynomials this
+    is the same as calling :func:`jordan_decomposition` on each matrix.
+
+    INPUT:
+
+    - ``matrices`` -- a list of square matrices
+
+    OUTPUT:
+
+    A list of pairs ``(A_s, A_n)`` as returned by :func:`jordan_decomposition`.
+
+    EXAMPLES:
+
+    The matrices ``A`` and ``B = 4 - A`` have the same minimal polynomial
+    `(x-2)^2`, so the polynomials of the algorithm are computed only once::
+
+        sage: from lie_gradings.gradings.utilities import jordan_decompositions
+        sage: A = matrix(QQ, [[1, 1], [-1, 3]])
+        sage: B = 4 - A
+        sage: A.minpoly() == B.minpoly()
+        True
+        sage: decompositions = jordan_decompositions([A, B])
+        sage: [As for As, An in decompositions]
+        [
+        [2 0]  [2 0]
+        [0 2], [0 2]
+        ]
+        sage: [An for As, An in decompositions]
+        [
+        [-1  1]  [ 1 -1]
+        [-1  1], [ 1 -1]
+        ]
+
+    TESTS::
+
+        sage: from lie_gradings.gradings.utilities import _jordan_decomposition
+        sage: polys = {}
+        sage: _ = [_jordan_decomposition(M, polys) for M in [A, B]]
+        sage: list(polys)
+        [x^2 - 4*x + 4]
+    """
+    polys = {}
+    return [_jordan_decomposition(A, polys) for A in matrices]
+
+
+def _jordan_decomposition(A, polys):
+    r"""
+    Return the Jordan decomposition of the matrix ``A``.
+
+    The dictionary ``polys`` caches the pairs of polynomials ``(h, q)``
+    of the algorithm of :func:`jordan_decomposition` by minimal
+    polynomial, and is updated with any new pairs.
     """
+    n = A.nrows()
+    offdiag = [(i, j) for i, j in A.nonzero_positions() if i != j]
+    if not offdiag:
+        # diagonal matrices are semisimple
+        return (A, A.parent().zero())
+
+    diag = A.diagonal()
+    if all(i < j for i, j in offdiag) or all(i > j for i, j in offdiag):
+        if all(d == diag[0] for d in diag):
+            # the semisimple part is the constant diagonal
+            As = diag[0] * A.parent().identity_matrix()
+            return (As, A - As)
+        if len(set(diag)) == n:
+            # distinct eigenvalues, so the matrix is diagonalizable
+            return (A, A.parent().zero())
+
+    # find the blocks of a block diagonal structure as connected
+    # components of the nonzero off-diagonal entries
+    component = list(range(n))
+
+    def root(i):
+        while component[i] != i:
+            component[i] = component[component[i]]
+            i = component[i]
+        return i
+
+    for i, j in offdiag:
+        component[root(i)] = root(j)
+    blocks = {}
+    for i in range(n):
+        blocks.setdefault(root(i), []).append(i)
+
+    if len(blocks) > 1:
+        As = A.parent().zero().__copy__()
+        for idx in blocks.values():
+            Bs, Bn = _jordan_decomposition(
+                A.matrix_from_rows_and_columns(idx, idx), polys)
+            for a, i in enumerate(idx):
+                for b, j in enumerate(idx):
+                    As[i, j] = Bs[a, b]
+        return (As, A - As)
+
     f = A.minpoly()
-    h = f / f.gcd(f.derivative())
-    d, p, q = h.xgcd(h.derivative())
+    try:
+        h, q = polys[f]
+    except KeyError:
+        h = f / f.gcd(f.derivative())
+        d, p, q = h.xgcd(h.derivative())
 
-    # in case d = gcd(h, h') is not 1, normalize
-    q = q / d
+        # in case d = gcd(h, h') is not 1, normalize
+        q = q / d
+        polys[f] = (h, q)
 
     Ak = A
     while h(Ak) != 0:
         Ak = Ak - h(Ak) * q(Ak)
     return (Ak, A - Ak)
+
+
+def derivations_basis(L):
+    r"""
+    Return a basis of the Lie algebra of derivations of ``L``.
+
+    The Leibniz rule `D[X_i,X_j] = [DX_i,X_j] + [X_i,DX_j]` is a linear
+    system in the entries of `D`. Each nonzero structure coefficient
+    contributes only a few terms to the system, so the system is built
+    as a sparse matrix directly from the nonzero structure coefficients
+    and solved by sparse elimination.
+
+    INPUT:
+
+    - ``L`` -- a finite dimensional Lie algebra with basis
+
+    OUTPUT:
+
+    A tuple of matrices in the same format as
+    :meth:`~sage.categories.finite_dimensional_lie_algebras_with_basis.FiniteDimensionalLieAlgebrasWithBasis.ParentMethods.derivations_basis`,
+    i.e., matrices acting on the coordinate vectors of ``L`` from the left.
+
+    EXAMPLES::
+
+        sage: from lie_gradings.gradings.utilities import derivations_basis
+        sage: L = lie_algebras.Heisenberg(QQ, 1)
+        sage: len(derivations_basis(L))
+        6
+
+    The derivations span the same space as the ones computed by Sage::
+
+        sage: def span(ds):
+        ....:     return matrix([D.list() for D in ds]).row_space()
+        sage: L = LieAlgebra(QQ, 2, step=3)
+        sage: span(derivations_basis(L)) == span(L.derivations_basis())
+        True
+        sage: L.<X,Y> = LieAlgebra(QQ, {('X','Y'): {'Y': 1}})
+        sage: span(derivations_basis(L)) == span(L.derivations_basis())
+        True
+    """
+    R = L.base_ring()
+    keys = list(L.basis().keys())
+    n = len(keys)
+    index = {x: i for i, x in enumerate(keys)}
+
+    # the nonzero structure coefficients c[(i,j)] = {k: c_ij^k}
+    # stored for both orderings of the pair
+    c = {}
+    for (x, y), v in L.structure_coefficients().items():
+        i = index[x]
+        j = index[y]
+        cij = {index[z]: czk for z, czk in v.monomial_coefficients().items()
+               if czk}
+        if cij:
+            c[(i, j)] = cij
+            c[(j, i)] = {k: -czk for k, czk in cij.items()}
+
+    # the nonzero brackets into and out of each basis element
+    left = {}
+    right = {}
+    for (i, j) in c:
+        left.setdefault(j, []).append(i)
+        right.setdefault(i, []).append(j)
+
+    def var(l, k):
+        # the index of the entry D[l,k] in the row-major flattening of D
+        return l * n + k
+
+    # the equation (i, j, l) is the coefficient of X_l in
+    # D[X_i,X_j] - [DX_i,X_j] - [X_i,DX_j] = 0, i.e.,
+    # sum_k c_ij^k D[l,k] - sum_m c_mj^l D[m,i] - sum_m c_im^l D[m,j] = 0
+    entries = {}
+    rows = {}
+
+    def add(i, j, l, v, coeff):
+        r = rows.setdefault((i, j, l), len(rows))
+        entries[(r, v)] = entries.get((r, v), 0) + coeff
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            for k, cijk in c.get((i, j), {}).items():
+                for l in range(n):
+                    add(i, j, l, var(l, k), cijk)
+            for m in left.get(j, []):
+                for l, cmjl in c[(m, j)].items():
+                    add(i, j, l, var(m, i), -cmjl)
+            for m in right.get(i, []):
+                for l, ciml in c[(i, m)].items():
+                    add(i, j, l, var(m, j), -ciml)
+
+    entries = {rv: e for rv, e in entries.items() if e}
+    A = matrix(R, len(rows), n * n, entries, sparse=True)
+    return tuple(matrix(R, n, n, list(b)) for b in A.right_kernel().basis())